@@ -0,0 +1,130 @@
+import asyncio
+from bisect import bisect_left, insort
+
+from core.db import db_list_signups_by_guild
+
+# Discord 最多顯示 25 個選項，且要在 3 秒內回應
+MAX_SUGGESTIONS = 25
+LOAD_TIMEOUT_SECONDS = 1.0
+
+def fold(value) -> str:
+    """比對用的 key：不分大小寫、前後與連續空白都視為一樣（Tank / tank / 「tank 」是同一個值）。"""
+    return " ".join((value or "").split()).casefold()
+
+class PrefixIndex:
+    """單一欄位的候選值：排序好的 key 讓前綴查詢只需 bisect，人數多的排前面。
+
+    大小寫 / 空白不同的寫法合併成同一個候選，顯示基本選項的寫法，沒有的話顯示最多人用的寫法。
+    """
+
+    def __init__(self, canonical=()):
+        self._spellings = {}   # key -> {寫法: 人數}
+        self._canonical = {}   # key -> 基本選項的寫法
+        self._keys = []        # 排序好的 key
+        for value in canonical:
+            self._canonical[fold(value)] = value.strip()
+            self._ensure(fold(value))
+
+    def _ensure(self, key: str):
+        if key not in self._spellings:
+            self._spellings[key] = {}
+            insort(self._keys, key)
+
+    def add(self, value: str, count: int = 1):
+        value = " ".join((value or "").split())
+        key = value.casefold()
+        if not key or len(value) > 100:
+            return
+        self._ensure(key)
+        spellings = self._spellings[key]
+        spellings[value] = spellings.get(value, 0) + count
+
+    def remove(self, value: str):
+        value = " ".join((value or "").split())
+        spellings = self._spellings.get(value.casefold())
+        if spellings and spellings.get(value, 0) > 0:
+            spellings[value] -= 1
+
+    def _count(self, key: str) -> int:
+        return sum(self._spellings[key].values())
+
+    def _display(self, key: str) -> str:
+        if key in self._canonical:
+            return self._canonical[key]
+        spellings = self._spellings[key]
+        return max(spellings, key=spellings.get)
+
+    def suggest(self, current: str, limit: int = MAX_SUGGESTIONS):
+        current = fold(current)
+        # 只剩 0 人、又不是基本選項的寫法（例如大家都改掉了）不再建議
+        live = lambda k: k in self._canonical or self._count(k) > 0
+        if not current:
+            keys = sorted((k for k in self._keys if live(k)), key=lambda k: -self._count(k))
+            return [self._display(k) for k in keys[:limit]]
+
+        matches = []
+        i = bisect_left(self._keys, current)
+        while i < len(self._keys) and self._keys[i].startswith(current):
+            if live(self._keys[i]):
+                matches.append(self._keys[i])
+            i += 1
+        matches.sort(key=lambda k: -self._count(k))
+        if len(matches) < limit:
+            # 前綴不夠時再補上包含輸入文字的值（例如只打了流派名稱）
+            seen = set(matches)
+            matches += [k for k in self._keys if current in k and k not in seen and live(k)]
+        return [self._display(k) for k in matches[:limit]]
+
+class GuildSuggestions:
+    """每個伺服器、每個欄位一份記憶體索引；第一次用到時從資料庫載入一次，之後隨報名增量更新。"""
+
+    def __init__(self, fields):
+        self._fields = fields   # 欄位名稱 -> 基本選項
+        self._indexes = {}      # (guild_id, 欄位) -> PrefixIndex
+        self._members = {}      # guild_id -> {user_id: {欄位: 值}}，人數以成員計、不是以報名次數計
+        self._loading = {}      # guild_id -> 載入中的 task
+
+    async def _load(self, guild_id: int):
+        rows = await asyncio.to_thread(db_list_signups_by_guild, guild_id, ["user_id", *self._fields])
+        indexes = {field: PrefixIndex(canonical) for field, canonical in self._fields.items()}
+        members = {}
+        for r in rows:
+            members[r["user_id"]] = {field: r[field] for field in self._fields}
+            for field, index in indexes.items():
+                index.add(r[field])
+        self._members[guild_id] = members
+        for field, index in indexes.items():
+            self._indexes[(guild_id, field)] = index
+
+    async def suggest(self, guild_id: int, field: str, current: str):
+        index = self._indexes.get((guild_id, field))
+        if index is None:
+            task = self._loading.get(guild_id)
+            if task is None:
+                task = self._loading[guild_id] = asyncio.create_task(self._load(guild_id))
+                task.add_done_callback(lambda t: self._loading.pop(guild_id, None))
+            try:
+                await asyncio.wait_for(asyncio.shield(task), LOAD_TIMEOUT_SECONDS)
+            except Exception:
+                pass  # 資料庫太慢就先只給基本選項，載入完成後下一次按鍵就有完整建議
+            index = self._indexes.get((guild_id, field)) or PrefixIndex(self._fields[field])
+        return index.suggest(current)
+
+    def record(self, guild_id: int, info: dict):
+        """報名寫入後更新索引（尚未載入的伺服器等第一次查詢時再從資料庫載入）。
+
+        同一位成員重複報名時，只在值有變時才把舊值減一、新值加一。
+        """
+        members = self._members.get(guild_id)
+        if members is None:
+            return
+        previous = members.setdefault(info["user_id"], {})
+        for field in self._fields:
+            index = self._indexes.get((guild_id, field))
+            old, new = previous.get(field), info.get(field)
+            if index is None or old == new:
+                continue
+            if old is not None:
+                index.remove(old)
+            index.add(new)
+            previous[field] = new
@@ -1,21 +1,80 @@
 import os
 import io
-from datetime import datetime
+import asyncio
+from datetime import datetime, timedelta, timezone
 
 import discord
+import psycopg2
 from discord import app_commands
 from discord.ext import commands
 
-from db import init_db, db_upsert_signup, db_get_signup, db_list_signups_by_guild
+from core.db import (
+    init_db, db_get_signup,
+    db_snapshot_lineup, db_list_snapshots, db_compare_snapshot,
+    db_get_snapshot_members, db_lineup_at,
+    db_bulk_set_team, db_bulk_delete_signups,
+    db_archive_stale_signups, ARCHIVE_AFTER_DAYS,
+)
+from core.export import export_guild_csv, start_export
+from core.roster import TEAMS, CANONICAL_JOBS, CANONICAL_VOICES
+from signup_journal import journal_append, journal_latest, replay_journal_forever
+from change_feed import watch_signup_changes
+from roster_digest import RosterDigest, render_roster
+from role_sync import ROLE_SYNC_ENABLED, RoleSync
+from autocomplete import GuildSuggestions
 
 intents = discord.Intents.default()
 intents.guilds = True
+# 身分組同步需要成員清單（需在開發者後台開啟 Server Members Intent）
+intents.members = ROLE_SYNC_ENABLED
 bot = commands.Bot(command_prefix="!", intents=intents)
+journal_wake = asyncio.Event()
+roster_digest = RosterDigest(bot)
+role_sync = RoleSync(bot)
+suggestions = GuildSuggestions({"job": CANONICAL_JOBS, "voice": CANONICAL_VOICES})
+
+async def archive_stale_signups_daily():
+    while True:
+        try:
+            moved = await asyncio.to_thread(db_archive_stale_signups, ARCHIVE_AFTER_DAYS)
+            if moved:
+                print(f"🗄️ 已封存 {moved} 筆超過 {ARCHIVE_AFTER_DAYS} 天未更新的報名。")
+        except Exception as e:
+            print(f"⚠️ 封存舊報名失敗：{e}")
+        await asyncio.sleep(24 * 3600)
+
+@bot.event
+async def setup_hook():
+    bot.loop.create_task(replay_journal_forever(journal_wake))
+    if ARCHIVE_AFTER_DAYS > 0:
+        bot.loop.create_task(archive_stale_signups_daily())
+    await roster_digest.load()
+    listeners = [roster_digest.mark_dirty]
+    if ROLE_SYNC_ENABLED:
+        role_sync.start()
+        listeners.append(role_sync.mark_dirty)
+    bot.loop.create_task(watch_signup_changes(listeners))
 
 @bot.event
 async def on_ready():
     await bot.tree.sync()
     print(f"✅ Discord Bot 已登入為 {bot.user}，Slash 指令已同步。")
+    if ROLE_SYNC_ENABLED:
+        # 啟動時整體比對一次，補上 bot 離線期間的隊伍異動
+        role_sync.mark_dirty([g.id for g in bot.guilds])
+
+@bot.tree.error
+async def on_app_command_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
+    original = getattr(error, "original", error)
+    if not isinstance(original, psycopg2.OperationalError):
+        await app_commands.CommandTree.on_error(bot.tree, interaction, error)
+        return
+    # 資料庫斷線、逾時或斷路中時回覆簡短訊息，不讓成員等到互動逾時
+    message = "🚫 資料庫暫時無法連線，請稍後再試（/signup 仍可正常報名）。"
+    if interaction.response.is_done():
+        await interaction.followup.send(message, ephemeral=True)
+    else:
+        await interaction.response.send_message(message, ephemeral=True)
 
 @bot.tree.command(name="signup", description="幫戰報名 / 更新資料")
 @app_commands.describe(
@@ -40,28 +99,27 @@ async def signup(
         await interaction.response.send_message("⚠️ 請在伺服器頻道內使用此指令。", ephemeral=True)
         return
 
-    try:
-        existing = db_get_signup(guild.id, user.id) or {}
-        team = existing.get("team", "未分配")
-
-        info = {
-            "user_id": user.id,
-            "user_name": f"{user.name}#{user.discriminator}",
-            "display_name": user.display_name,
-            "job": job,
-            "gear": gear,
-            "availability": availability,
-            "voice": voice,
-            "note": note,
-            "team": team,
-            "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
-        }
-
-        db_upsert_signup(guild.id, user.id, info)
+    info = {
+        "user_id": user.id,
+        "user_name": f"{user.name}#{user.discriminator}",
+        "display_name": user.display_name,
+        "job": job,
+        "gear": gear,
+        "availability": availability,
+        "voice": voice,
+        "note": note,
+        "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+    }
 
+    # 先寫入本機日誌就回覆，背景再批次寫進資料庫（資料庫慢或斷線都不影響報名）
+    # 日誌每次 commit 都會 fsync，丟到 thread 才不會在大量報名時卡住 event loop
+    try:
+        await asyncio.to_thread(journal_append, guild.id, user.id, info)
     except Exception as e:
-        await interaction.response.send_message(f"🚫 寫入資料庫失敗：{e}", ephemeral=True)
+        await interaction.response.send_message(f"🚫 寫入報名資料失敗：{e}", ephemeral=True)
         return
+    journal_wake.set()
+    suggestions.record(guild.id, info)
 
     embed = discord.Embed(
         title="✅ 幫戰報名成功",
@@ -74,11 +132,24 @@ async def signup(
     embed.add_field(name="可出席時段", value=availability, inline=False)
     embed.add_field(name="語音狀況", value=voice, inline=True)
     embed.add_field(name="備註", value=note if note else "（無）", inline=False)
-    embed.add_field(name="目前隊伍", value=team, inline=True)
-    embed.set_footer(text="如需修改，直接再次使用 /signup 覆寫即可。")
+    embed.set_footer(text="如需修改，直接再次使用 /signup 覆寫即可；目前隊伍可用 /mysignup 查看。")
 
     await interaction.response.send_message(embed=embed, ephemeral=True)
 
+@signup.autocomplete("job")
+async def signup_job_autocomplete(interaction: discord.Interaction, current: str):
+    if interaction.guild is None:
+        return []
+    values = await suggestions.suggest(interaction.guild.id, "job", current)
+    return [app_commands.Choice(name=v, value=v) for v in values]
+
+@signup.autocomplete("voice")
+async def signup_voice_autocomplete(interaction: discord.Interaction, current: str):
+    if interaction.guild is None:
+        return []
+    values = await suggestions.suggest(interaction.guild.id, "voice", current)
+    return [app_commands.Choice(name=v, value=v) for v in values]
+
 @bot.tree.command(name="mysignup", description="查看自己幫戰報名資料")
 async def mysignup(interaction: discord.Interaction):
     guild = interaction.guild
@@ -88,9 +159,20 @@ async def mysignup(interaction: discord.Interaction):
         await interaction.response.send_message("⚠️ 請在伺服器頻道內使用此指令。", ephemeral=True)
         return
 
-    info = db_get_signup(guild.id, user.id)
+    # 資料庫查詢丟到 thread，資料庫卡住時不會拖住其他指令
+    await interaction.response.defer(ephemeral=True)
+    # 還沒回放到資料庫的報名以日誌為準，隊伍仍以資料庫為準
+    pending = await asyncio.to_thread(journal_latest, guild.id, user.id)
+    try:
+        info = await asyncio.to_thread(db_get_signup, guild.id, user.id)
+    except Exception:
+        if pending is None:
+            raise
+        info = None
+    if pending is not None:
+        info = {"team": "未分配", **(info or {}), **pending}
     if not info:
-        await interaction.response.send_message("你還沒有填寫幫戰報名，可以使用 `/signup` 登記。", ephemeral=True)
+        await interaction.followup.send("你還沒有填寫幫戰報名，可以使用 `/signup` 登記。", ephemeral=True)
         return
 
     embed = discord.Embed(title="📋 你的幫戰報名資料", color=0x00d1c4)
@@ -102,7 +184,7 @@ async def mysignup(interaction: discord.Interaction):
     embed.add_field(name="隊伍", value=info.get("team", "未分配"), inline=True)
     embed.add_field(name="備註", value=info.get("note", "（無）"), inline=False)
     embed.set_footer(text=f"最後更新時間：{info.get('timestamp', '未知')}")
-    await interaction.response.send_message(embed=embed, ephemeral=True)
+    await interaction.followup.send(embed=embed, ephemeral=True)
 
 @bot.tree.command(name="list_signups", description="匯出幫戰報名 CSV（管理員用）")
 async def list_signups(interaction: discord.Interaction):
@@ -117,38 +199,269 @@ async def list_signups(interaction: discord.Interaction):
         await interaction.response.send_message("🚫 你沒有使用此指令的權限（需管理伺服器權限）。", ephemeral=True)
         return
 
-    data = db_list_signups_by_guild(guild.id)
-    if not data:
-        await interaction.response.send_message("目前沒有任何幫戰報名資料。", ephemeral=True)
-        return
-
-    output = io.StringIO()
-    headers = ["UserID", "顯示名稱", "職業流派", "裝備境界", "可出席時段", "語音狀況", "隊伍", "備註", "最後更新時間"]
-    output.write(",".join(headers) + "\n")
-
-    for info in data:
-        uid = str(info["user_id"])
-        row = [
-            uid,
-            info.get("display_name", "").replace(",", "，"),
-            info.get("job", "").replace(",", "，"),
-            info.get("gear", "").replace(",", "，"),
-            info.get("availability", "").replace(",", "，"),
-            info.get("voice", "").replace(",", "，"),
-            info.get("team", "未分配").replace(",", "，"),
-            info.get("note", "").replace("\n", " ").replace(",", "，"),
-            info.get("timestamp", ""),
-        ]
-        output.write(",".join(row) + "\n")
-
-    output.seek(0)
-    file = discord.File(fp=io.BytesIO(output.getvalue().encode("utf-8")), filename="signups.csv")
-    await interaction.response.send_message(
-        content=f"📂 共有 **{len(data)}** 筆幫戰報名資料，以下為匯出檔：",
+    # 查詢與產生 CSV 都丟到 thread，不佔用 event loop；資料庫慢時可能超過 3 秒，先 defer
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    data = await asyncio.to_thread(export_guild_csv, guild.id)
+    count = data.count(b"\n") - 1
+    if count <= 0:
+        await interaction.followup.send("目前沒有任何幫戰報名資料。", ephemeral=True)
+        return
+
+    file = discord.File(fp=io.BytesIO(data), filename="signups.csv")
+    await interaction.followup.send(
+        content=f"📂 共有 **{count}** 筆幫戰報名資料，以下為匯出檔：",
         file=file,
         ephemeral=True,
     )
 
+@bot.tree.command(name="export_signups", description="匯出多個伺服器的幫戰報名 zip（管理員用）")
+@app_commands.describe(scope="匯出範圍")
+@app_commands.choices(scope=[
+    app_commands.Choice(name="我有管理權限的所有伺服器", value="managed"),
+    app_commands.Choice(name="只有這個伺服器", value="this"),
+])
+async def export_signups(interaction: discord.Interaction, scope: str = "managed"):
+    guild = interaction.guild
+    user = interaction.user
+
+    if guild is None:
+        await interaction.response.send_message("⚠️ 請在伺服器頻道內使用此指令。", ephemeral=True)
+        return
+
+    if not user.guild_permissions.manage_guild:
+        await interaction.response.send_message("🚫 你沒有使用此指令的權限（需管理伺服器權限）。", ephemeral=True)
+        return
+
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    guild_ids = [guild.id]
+    skipped = 0
+    if scope == "managed":
+        for g in bot.guilds:
+            if g.id == guild.id:
+                continue
+            # 沒開 members intent 時快取裡沒有成員，改向 API 查詢
+            member = g.get_member(user.id)
+            if member is None:
+                try:
+                    member = await g.fetch_member(user.id)
+                except discord.NotFound:
+                    continue
+                except discord.HTTPException:
+                    skipped += 1
+                    continue
+            if member.guild_permissions.manage_guild:
+                guild_ids.append(g.id)
+
+    job = start_export(guild_ids)
+    # 匯出在背景 worker pool 進行，這裡只輪詢進度
+    while job.state in ("pending", "running"):
+        await asyncio.sleep(1)
+    if job.state == "failed":
+        await interaction.followup.send(f"🚫 匯出失敗：{job.error}", ephemeral=True)
+        return
+
+    await interaction.followup.send(
+        content=f"📦 已匯出 **{job.done}** 個伺服器、共 **{job.rows}** 筆幫戰報名資料："
+                + (f"\n⚠️ 另有 {skipped} 個伺服器無法確認你的權限，未包含在內。" if skipped else ""),
+        file=discord.File(job.path, filename="signups.zip"),
+        ephemeral=True,
+    )
+
+@bot.tree.command(name="war_snapshot", description="凍結目前幫戰陣容，方便之後比對（管理員用）")
+@app_commands.describe(label="快照名稱（例：12/24 幫戰）")
+async def war_snapshot(interaction: discord.Interaction, label: str = ""):
+    guild = interaction.guild
+    user = interaction.user
+
+    if guild is None:
+        await interaction.response.send_message("⚠️ 請在伺服器頻道內使用此指令。", ephemeral=True)
+        return
+
+    if not user.guild_permissions.manage_guild:
+        await interaction.response.send_message("🚫 你沒有使用此指令的權限（需管理伺服器權限）。", ephemeral=True)
+        return
+
+    if not label:
+        label = datetime.utcnow().strftime("%Y-%m-%d %H:%M") + " UTC"
+    await interaction.response.defer(ephemeral=True)
+    snapshot_id, count = await asyncio.to_thread(db_snapshot_lineup, guild.id, label)
+    await interaction.followup.send(
+        f"📸 已建立陣容快照 **#{snapshot_id}**（{label}），共 **{count}** 人。",
+        ephemeral=True,
+    )
+
+@bot.tree.command(name="war_compare", description="比對陣容快照與目前名單的差異（管理員用）")
+@app_commands.describe(snapshot_id="快照編號（留空則使用最近一次快照）")
+async def war_compare(interaction: discord.Interaction, snapshot_id: int = 0):
+    guild = interaction.guild
+    user = interaction.user
+
+    if guild is None:
+        await interaction.response.send_message("⚠️ 請在伺服器頻道內使用此指令。", ephemeral=True)
+        return
+
+    if not user.guild_permissions.manage_guild:
+        await interaction.response.send_message("🚫 你沒有使用此指令的權限（需管理伺服器權限）。", ephemeral=True)
+        return
+
+    await interaction.response.defer(ephemeral=True)
+    if not snapshot_id:
+        snapshots = await asyncio.to_thread(db_list_snapshots, guild.id)
+        if not snapshots:
+            await interaction.followup.send("目前沒有任何陣容快照，可以先用 `/war_snapshot` 建立。", ephemeral=True)
+            return
+        snapshot_id = snapshots[0]["snapshot_id"]
+
+    diff = await asyncio.to_thread(db_compare_snapshot, guild.id, snapshot_id)
+    if diff is None:
+        await interaction.followup.send(f"找不到快照 #{snapshot_id}。", ephemeral=True)
+        return
+    if not diff:
+        await interaction.followup.send(f"快照 #{snapshot_id} 與目前陣容完全相同。", ephemeral=True)
+        return
+
+    lines = []
+    for d in diff[:30]:
+        before = d["snapshot_team"] or "（未報名）"
+        after = d["current_team"] or "（已不在名單）"
+        lines.append(f"• {d['display_name']}：{before} → {after}")
+    if len(diff) > 30:
+        lines.append(f"…另有 {len(diff) - 30} 人")
+    await interaction.followup.send(
+        f"🔍 快照 #{snapshot_id} 之後共有 **{len(diff)}** 人異動：\n" + "\n".join(lines),
+        ephemeral=True,
+    )
+
+@bot.tree.command(name="war_lineup", description="查看過去某個時間點或某份快照的陣容（管理員用）")
+@app_commands.describe(
+    at="時間（UTC，例：2026-10-12 20:30）；留空則看目前陣容",
+    snapshot_id="快照編號（填了就改看這份快照）",
+)
+async def war_lineup(interaction: discord.Interaction, at: str = "", snapshot_id: int = 0):
+    guild = interaction.guild
+    user = interaction.user
+
+    if guild is None:
+        await interaction.response.send_message("⚠️ 請在伺服器頻道內使用此指令。", ephemeral=True)
+        return
+
+    if not user.guild_permissions.manage_guild:
+        await interaction.response.send_message("🚫 你沒有使用此指令的權限（需管理伺服器權限）。", ephemeral=True)
+        return
+
+    when = datetime.now(timezone.utc)
+    if at:
+        try:
+            when = datetime.strptime(at.strip(), "%Y-%m-%d %H:%M").replace(tzinfo=timezone.utc)
+        except ValueError:
+            await interaction.response.send_message("⚠️ 時間格式錯誤，請用 `YYYY-MM-DD HH:MM`（UTC）。", ephemeral=True)
+            return
+
+    await interaction.response.defer(ephemeral=True)
+    if snapshot_id:
+        snapshots = await asyncio.to_thread(db_list_snapshots, guild.id)
+        snapshot = next((s for s in snapshots if s["snapshot_id"] == snapshot_id), None)
+        if snapshot is None:
+            await interaction.followup.send(f"找不到快照 #{snapshot_id}。", ephemeral=True)
+            return
+        rows = await asyncio.to_thread(db_get_snapshot_members, snapshot_id)
+        label = snapshot["label"] or f"{snapshot['taken_at']:%Y-%m-%d %H:%M}"
+        title = f"📸 快照 #{snapshot_id}（{label}）"
+    else:
+        # 由異動紀錄還原，可以看到沒有拍快照的幫戰當晚陣容
+        rows = await asyncio.to_thread(db_lineup_at, guild.id, when)
+        title = f"🕰️ {when:%Y-%m-%d %H:%M} UTC 的陣容"
+
+    total, fields = render_roster(rows)
+    embed = discord.Embed(title=title, description=f"總人數：**{total}**", color=0x00d1c4)
+    for name, value in fields:
+        embed.add_field(name=name, value=value, inline=True)
+    await interaction.followup.send(embed=embed, ephemeral=True)
+
+@bot.tree.command(name="roster_pin", description="在此頻道釘選自動更新的幫戰名單（管理員用）")
+async def roster_pin(interaction: discord.Interaction):
+    guild = interaction.guild
+    user = interaction.user
+
+    if guild is None:
+        await interaction.response.send_message("⚠️ 請在伺服器頻道內使用此指令。", ephemeral=True)
+        return
+
+    if not user.guild_permissions.manage_guild:
+        await interaction.response.send_message("🚫 你沒有使用此指令的權限（需管理伺服器權限）。", ephemeral=True)
+        return
+
+    await interaction.response.defer(ephemeral=True)
+    await roster_digest.pin(interaction.channel, guild.id)
+    await interaction.followup.send("📌 已在此頻道建立名單摘要，之後報名或隊伍異動會自動更新。", ephemeral=True)
+
+TEAM_CHOICES = [app_commands.Choice(name=t, value=t) for t in TEAMS]
+
+@bot.tree.command(name="bulk_roster", description="批次調整 / 清除幫戰名單（管理員用）")
+@app_commands.describe(
+    action="要執行的動作",
+    to_team="移到哪個隊伍（動作為「移到隊伍」時必填）",
+    from_team="只處理這個隊伍的成員",
+    except_team="排除這個隊伍的成員",
+    job="只處理這個職業的成員",
+    inactive_days="只處理超過幾天未更新的成員",
+    confirm="確認執行（清除名單時必須勾選）",
+)
+@app_commands.choices(
+    action=[
+        app_commands.Choice(name="移到隊伍", value="move"),
+        app_commands.Choice(name="刪除報名", value="clear"),
+    ],
+    to_team=TEAM_CHOICES,
+    from_team=TEAM_CHOICES,
+    except_team=TEAM_CHOICES,
+)
+async def bulk_roster(
+    interaction: discord.Interaction,
+    action: str,
+    to_team: str = "",
+    from_team: str = "",
+    except_team: str = "",
+    job: str = "",
+    inactive_days: int = 0,
+    confirm: bool = False,
+):
+    guild = interaction.guild
+    user = interaction.user
+
+    if guild is None:
+        await interaction.response.send_message("⚠️ 請在伺服器頻道內使用此指令。", ephemeral=True)
+        return
+
+    if not user.guild_permissions.manage_guild:
+        await interaction.response.send_message("🚫 你沒有使用此指令的權限（需管理伺服器權限）。", ephemeral=True)
+        return
+
+    filters = {
+        "teams": [from_team] if from_team else None,
+        "exclude_teams": [except_team] if except_team else None,
+        "jobs": [job] if job else None,
+        "updated_before": None,
+    }
+    if inactive_days > 0:
+        filters["updated_before"] = datetime.now(timezone.utc) - timedelta(days=inactive_days)
+
+    if action == "clear":
+        if not confirm:
+            await interaction.response.send_message("⚠️ 清除名單無法復原，請加上 `confirm: True` 再執行一次。", ephemeral=True)
+            return
+        await interaction.response.defer(ephemeral=True)
+        count = await asyncio.to_thread(db_bulk_delete_signups, guild.id, **filters)
+        await interaction.followup.send(f"🧹 已刪除 **{count}** 筆報名資料。", ephemeral=True)
+        return
+
+    if not to_team:
+        await interaction.response.send_message("⚠️ 請選擇要移到的隊伍（to_team）。", ephemeral=True)
+        return
+    await interaction.response.defer(ephemeral=True)
+    count = await asyncio.to_thread(db_bulk_set_team, guild.id, to_team, **filters)
+    await interaction.followup.send(f"✅ 已將 **{count}** 人移到「{to_team}」。", ephemeral=True)
+
 def main():
     init_db()
     token = os.environ.get("DISCORD_BOT_TOKEN")
@@ -0,0 +1,32 @@
+import asyncio
+from datetime import timedelta
+
+from core.db import db_changed_guilds_since, note_write
+
+# 輪詢 signup_history 找出有變動的伺服器（網頁後台、批次操作、報名回放都會寫入紀錄）
+CHANGE_POLL_SECONDS = 10.0
+# 交易時間早於 commit 時間，多往回看一點避免漏掉
+CHANGE_POLL_OVERLAP = timedelta(seconds=5)
+
+async def watch_signup_changes(listeners, interval: float = CHANGE_POLL_SECONDS):
+    """listeners: [callable(guild_ids)]，每次輪詢把有新異動的伺服器交給每個 listener。"""
+    since = None
+    seen = {}
+    while True:
+        try:
+            rows, now = await asyncio.to_thread(db_changed_guilds_since, since)
+            changed = set()
+            for guild_id, last_changed, count in rows:
+                if seen.get(guild_id) != (last_changed, count):
+                    changed.add(guild_id)
+                seen[guild_id] = (last_changed, count)
+            since = now - CHANGE_POLL_OVERLAP
+            if changed:
+                # 其他行程寫入的異動也要讓接下來的讀取走主庫，避免讀到落後的副本
+                for guild_id in changed:
+                    note_write(guild_id)
+                for listener in listeners:
+                    listener(changed)
+        except Exception as e:
+            print(f"⚠️ 讀取名單異動失敗：{e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1 @@
+# 網頁後台與 Discord bot 共用的核心程式（資料庫、匯出、名單格式），不可 import discord / flask
@@ -0,0 +1,972 @@
+import os
+import time
+import threading
+import functools
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+import psycopg2
+from psycopg2.extras import RealDictCursor, execute_values
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+from core.roster import TEAMS
+
+SIGNUP_COLUMNS = (
+    "guild_id", "user_id", "user_name", "display_name", "job", "gear",
+    "availability", "voice", "note", "team", "timestamp", "updated_at",
+)
+
+# signup_history 以週分區，預先建立的週數
+HISTORY_WEEKS_AHEAD = 4
+_history_ready_until = None
+
+# 每個資料庫（主庫 / 副本）各一個連線池
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+# 閒置超過這個秒數的連線，借出前先 SELECT 1 確認還活著（資料庫重開、閒置連線被切斷）
+DB_POOL_PING_AFTER_SECONDS = float(os.environ.get("DB_POOL_PING_AFTER_SECONDS", "30"))
+# 經過 PgBouncer（transaction pooling）時要關掉：DB_PREPARED_STATEMENTS=0
+DB_PREPARED_STATEMENTS = os.environ.get("DB_PREPARED_STATEMENTS", "1") != "0"
+
+# 超過這個天數沒有更新的報名會被封存（0 = 不封存）
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", "0"))
+ARCHIVE_BATCH_SIZE = 500
+
+# 唯讀副本：設定 DATABASE_REPLICA_URL 後，讀取用的 helper 會改走副本
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get("REPLICA_MAX_LAG_SECONDS", "5"))
+REPLICA_CHECK_SECONDS = 10.0
+# 自己剛寫入的資料，這段時間內一律從主庫讀（read-your-writes）
+READ_YOUR_WRITES_SECONDS = float(os.environ.get("READ_YOUR_WRITES_SECONDS", "15"))
+
+# 資料庫卡住時不要讓 bot / 網頁一直等：連線、等連線池、單一查詢都有上限
+DB_CONNECT_TIMEOUT = int(os.environ.get("DB_CONNECT_TIMEOUT", "5"))
+DB_POOL_WAIT_SECONDS = float(os.environ.get("DB_POOL_WAIT_SECONDS", "10"))
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", "5000"))
+# 建表、封存、全部伺服器匯出這類較重的 helper 另外放寬
+DB_SLOW_STATEMENT_TIMEOUT_MS = int(os.environ.get("DB_SLOW_STATEMENT_TIMEOUT_MS", "60000"))
+
+# 斷路器：連續失敗這麼多次就暫停連線，過一段時間再用探測查詢試試看
+DB_BREAKER_FAILURES = int(os.environ.get("DB_BREAKER_FAILURES", "5"))
+DB_BREAKER_RESET_SECONDS = float(os.environ.get("DB_BREAKER_RESET_SECONDS", "30"))
+# 斷路時讀取 helper 改回傳最後一次成功的結果，最多保留這麼多筆
+DB_STALE_CACHE_SIZE = 2000
+
+_replica = {"checked_at": 0.0, "usable": False, "lag": None}
+_recent_writes = {}   # guild_id 或 (guild_id, user_id) -> time.monotonic()
+# bot 的 to_thread、日誌回放、change feed、Flask 的各個 thread 都會寫入
+_recent_writes_lock = threading.Lock()
+_recent_writes_swept = 0.0
+_force_primary = contextvars.ContextVar("force_primary", default=False)
+
+def get_database_url() -> str:
+    url = os.environ.get("DATABASE_URL")
+    if not url:
+        raise RuntimeError("環境變數 DATABASE_URL 未設定（PostgreSQL 未連上）")
+    return url
+
+def get_replica_url():
+    return os.environ.get("DATABASE_REPLICA_URL") or None
+
+class DatabaseUnavailable(psycopg2.OperationalError):
+    """斷路器開啟或連線池等不到連線時直接丟出，不再等資料庫。"""
+
+class _CircuitBreaker:
+    """closed：正常；連續失敗 DB_BREAKER_FAILURES 次後 open，直接拒絕；
+    DB_BREAKER_RESET_SECONDS 後 half_open，只放一個呼叫先跑探測查詢，成功才恢復。"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = None
+        self.last_error = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_call(self) -> bool:
+        """回傳這次呼叫是否要先跑探測查詢；斷路中則丟出 DatabaseUnavailable。"""
+        with self._lock:
+            if self.state == "closed":
+                return False
+            if self.state == "open" and time.monotonic() - self.opened_at >= DB_BREAKER_RESET_SECONDS:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+        raise DatabaseUnavailable(f"資料庫（{self.name}）暫時無法連線，稍後再試：{self.last_error}")
+
+    def record_success(self):
+        with self._lock:
+            if self.state != "closed":
+                print(f"✅ 資料庫（{self.name}）已恢復連線。")
+            self.state = "closed"
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self, error):
+        with self._lock:
+            self.failures += 1
+            self.last_error = str(error).strip()
+            if self.state == "half_open" or self.failures >= DB_BREAKER_FAILURES:
+                if self.state != "open":
+                    print(f"⚠️ 資料庫（{self.name}）連續失敗 {self.failures} 次，暫停連線 {DB_BREAKER_RESET_SECONDS:g} 秒：{self.last_error}")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+    def release_probe(self):
+        # 探測呼叫因為與資料庫無關的錯誤（例如 SQL 錯誤）結束時，讓下一個呼叫再探測
+        with self._lock:
+            self._probing = False
+
+    def status(self) -> dict:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "open_for": round(time.monotonic() - self.opened_at, 1) if self.state != "closed" else None,
+            "last_error": self.last_error,
+        }
+
+class _Connection(psycopg2.extensions.connection):
+    """記錄這條連線上已經 PREPARE 過的 statement；重新連線後是新的物件，會自動重新 prepare。"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+class _Pool:
+    """每個資料庫網址一組可重用的連線；全部借出時會等到有人歸還。"""
+
+    def __init__(self, url: str, name: str):
+        self._url = url
+        self._kwargs = {"connection_factory": _Connection, "connect_timeout": DB_CONNECT_TIMEOUT}
+        # Render Postgres 通常需要 SSL
+        if "sslmode=" not in url:
+            self._kwargs["sslmode"] = "require"
+        self._idle = []   # [(連線, 歸還時間), ...]
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(DB_POOL_SIZE)
+        self.breaker = _CircuitBreaker(name)
+
+    def _new_connection(self):
+        conn = psycopg2.connect(self._url, **self._kwargs)
+        # 連線層級的預設上限（每條連線只設一次）；較重的 helper 再用 SET LOCAL 放寬
+        with conn.cursor() as cur:
+            cur.execute("SET statement_timeout = %s;", (DB_STATEMENT_TIMEOUT_MS,))
+        conn.commit()
+        return conn
+
+    def _discard_idle(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            conn.close()
+
+    def _checkout(self):
+        """回傳 (連線, 是否為重複使用的舊連線)；閒置太久的先 ping，死掉的丟掉改拿下一條。"""
+        while True:
+            with self._lock:
+                conn, idle_since = self._idle.pop() if self._idle else (None, None)
+            if conn is None:
+                return self._new_connection(), False
+            if conn.closed:
+                continue
+            if time.monotonic() - idle_since < DB_POOL_PING_AFTER_SECONDS:
+                return conn, True
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1;")
+                conn.rollback()
+                return conn, True
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                # 一條斷了，其他閒置連線多半也斷了（例如資料庫重開），全部換新；不算資料庫故障
+                conn.close()
+                self._discard_idle()
+
+    @contextmanager
+    def connection(self, statement_timeout_ms: int = None):
+        probe = self.breaker.before_call()
+        if not self._slots.acquire(timeout=DB_POOL_WAIT_SECONDS):
+            if probe:
+                self.breaker.release_probe()
+            raise DatabaseUnavailable(f"資料庫（{self.breaker.name}）連線池已滿，等待 {DB_POOL_WAIT_SECONDS:g} 秒仍沒有空出的連線")
+        conn = None
+        reused = False
+        try:
+            conn, reused = self._checkout()
+            with conn:  # 正常結束 commit，例外時 rollback
+                if probe or statement_timeout_ms is not None:
+                    with conn.cursor() as cur:
+                        if probe:
+                            cur.execute("SELECT 1;")
+                        if statement_timeout_ms is not None:
+                            cur.execute("SET LOCAL statement_timeout = %s;", (statement_timeout_ms,))
+                yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            # 連不上、逾時、連線中斷才算資料庫故障；SQL 錯誤、資料錯誤不影響斷路器
+            if reused and conn.closed:
+                # 重複使用的舊連線已經斷了（ping 間隔內資料庫重開）：不算故障，清掉其他閒置連線，下次重新連線
+                self._discard_idle()
+                if probe:
+                    self.breaker.release_probe()
+            elif not isinstance(e, DatabaseUnavailable):
+                self.breaker.record_failure(e)
+            raise
+        except BaseException:
+            if probe:
+                self.breaker.release_probe()
+            raise
+        else:
+            self.breaker.record_success()
+        finally:
+            if conn is not None:
+                if not conn.closed and conn.info.transaction_status == TRANSACTION_STATUS_IDLE:
+                    with self._lock:
+                        self._idle.append((conn, time.monotonic()))
+                else:
+                    # 斷掉或狀態不明的連線直接丟掉，下次重新連線（prepared statement 也會重新 prepare）
+                    conn.close()
+            self._slots.release()
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def _get_pool(url: str, name: str) -> _Pool:
+    with _pools_lock:
+        pool = _pools.get(url)
+        if pool is None:
+            pool = _pools[url] = _Pool(url, name)
+    return pool
+
+def _connect(url: str, name: str = "primary", statement_timeout_ms: int = None):
+    return _get_pool(url, name).connection(statement_timeout_ms)
+
+def get_conn(statement_timeout_ms: int = None):
+    return _connect(get_database_url(), statement_timeout_ms=statement_timeout_ms)
+
+def db_ping():
+    """經過斷路器跑一次 SELECT 1；資料庫不通時丟出 psycopg2.OperationalError。"""
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1;")
+
+def db_health() -> dict:
+    """主庫 / 副本斷路器目前的狀態（給 /healthz 與監控用）。"""
+    try:
+        db_ping()
+        reachable = True
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        reachable = False   # 失敗也記在斷路器上，連續幾次就會斷路
+    health = {"primary": {"reachable": reachable, **_get_pool(get_database_url(), "primary").breaker.status()}}
+    url = get_replica_url()
+    if url is not None:
+        health["replica"] = {**_get_pool(url, "replica").breaker.status(), **replica_status()}
+    return health
+
+_stale_cache = OrderedDict()
+_stale_lock = threading.Lock()
+
+def _stale_fallback(func):
+    """讀取 helper 用：成功時記下結果；資料庫斷線或逾時時改回傳最後一次成功的結果（沒有就照樣丟出錯誤）。"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        key = (func.__name__, *(tuple(v) if isinstance(v, list) else v for v in args),
+               *sorted((k, tuple(v) if isinstance(v, list) else v) for k, v in kwargs.items()))
+        try:
+            result = func(*args, **kwargs)
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            with _stale_lock:
+                cached = _stale_cache.get(key)
+            if cached is None:
+                raise
+            print(f"⚠️ 資料庫無法使用，{func.__name__} 回傳 {time.monotonic() - cached[0]:.0f} 秒前的資料：{e}")
+            return cached[1]
+        with _stale_lock:
+            _stale_cache[key] = (time.monotonic(), result)
+            _stale_cache.move_to_end(key)
+            while len(_stale_cache) > DB_STALE_CACHE_SIZE:
+                _stale_cache.popitem(last=False)
+        return result
+    return wrapper
+
+def _prepare_sql(sql: str) -> str:
+    # %s 依序換成 $1, $2 ...
+    parts = sql.split("%s")
+    return "".join(p + (f"${i + 1}" if i < len(parts) - 1 else "") for i, p in enumerate(parts))
+
+def _prepared_call(cur, name: str) -> str:
+    """回傳執行這個查詢要送的 SQL；啟用 prepared statement 時，每條連線第一次用到才 PREPARE。"""
+    sql = PREPARED_STATEMENTS[name]
+    if not DB_PREPARED_STATEMENTS:
+        return sql
+    conn = cur.connection
+    if name not in conn.prepared:
+        cur.execute(f"PREPARE {name} AS {_prepare_sql(sql)};")
+        conn.prepared.add(name)
+    return f"EXECUTE {name} ({', '.join(['%s'] * sql.count('%s'))})"
+
+def execute_prepared(cur, name: str, params):
+    cur.execute(_prepared_call(cur, name), params)
+
+def execute_prepared_batch(cur, calls, page_size: int = 100):
+    """calls: [(名稱, 參數), ...]，多個查詢串成同一次送出（每頁一次 round trip）。"""
+    for i in range(0, len(calls), page_size):
+        page = calls[i:i + page_size]
+        cur.execute(
+            ";".join(_prepared_call(cur, name) for name, _ in page),
+            [p for _, params in page for p in params],
+        )
+
+def note_write(guild_id: int, user_id: int = None):
+    """記錄剛寫入過的伺服器 / 成員，之後一小段時間的讀取改走主庫。"""
+    global _recent_writes_swept
+    now = time.monotonic()
+    with _recent_writes_lock:
+        _recent_writes[guild_id] = now
+        if user_id is not None:
+            _recent_writes[(guild_id, user_id)] = now
+        # 清理最多每 READ_YOUR_WRITES_SECONDS 一次，寫入很密集時不會每次都掃整個 dict
+        if len(_recent_writes) > 10000 and now - _recent_writes_swept > READ_YOUR_WRITES_SECONDS:
+            _recent_writes_swept = now
+            cutoff = now - READ_YOUR_WRITES_SECONDS
+            for key in [k for k, t in _recent_writes.items() if t < cutoff]:
+                _recent_writes.pop(key, None)
+
+@contextmanager
+def primary_reads():
+    """區塊內的讀取一律走主庫（例如網頁剛存檔後的下一個請求）。"""
+    token = _force_primary.set(True)
+    try:
+        yield
+    finally:
+        _force_primary.reset(token)
+
+def replica_status() -> dict:
+    return {"configured": get_replica_url() is not None, **_replica}
+
+def _check_replica(url: str):
+    """比對主庫的 WAL 位置與副本已回放的位置，估算副本延遲。"""
+    lag = None
+    try:
+        with get_conn() as primary:
+            with primary.cursor() as cur:
+                cur.execute("SELECT pg_current_wal_lsn();")
+                primary_lsn = cur.fetchone()[0]
+        with _connect(url, "replica") as replica:
+            with replica.cursor() as cur:
+                cur.execute("""
+                    SELECT CASE
+                        WHEN NOT pg_is_in_recovery() THEN 0
+                        WHEN pg_last_wal_replay_lsn() >= %s::pg_lsn THEN 0
+                        ELSE EXTRACT(EPOCH FROM NOW() - pg_last_xact_replay_timestamp())
+                    END;
+                """, (primary_lsn,))
+                lag = cur.fetchone()[0]
+    except psycopg2.Error as e:
+        print(f"⚠️ 無法檢查唯讀副本，暫時改讀主庫：{e}")
+    _replica["checked_at"] = time.monotonic()
+    _replica["lag"] = float(lag) if lag is not None else None
+    _replica["usable"] = lag is not None and float(lag) <= REPLICA_MAX_LAG_SECONDS
+
+def get_read_conn(guild_id: int = None, user_id: int = None, statement_timeout_ms: int = None):
+    """唯讀查詢用的連線：有副本且延遲夠小時走副本，否則（或剛寫入過）走主庫。"""
+    url = get_replica_url()
+    if url is None or _force_primary.get():
+        return get_conn(statement_timeout_ms)
+
+    now = time.monotonic()
+    for key in (guild_id, (guild_id, user_id)):
+        written = _recent_writes.get(key)
+        if written is not None and now - written < READ_YOUR_WRITES_SECONDS:
+            return get_conn(statement_timeout_ms)
+
+    if now - _replica["checked_at"] > REPLICA_CHECK_SECONDS:
+        _check_replica(url)
+    if not _replica["usable"] or _get_pool(url, "replica").breaker.state != "closed":
+        return get_conn(statement_timeout_ms)
+    return _connect(url, "replica", statement_timeout_ms)
+
+_UPSERT_SIGNUP = """
+    WITH up AS (
+    INSERT INTO signups
+    (guild_id, user_id, user_name, display_name, job, gear, availability, voice, note, team, timestamp, updated_at)
+    VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,NOW())
+    ON CONFLICT (guild_id, user_id) DO UPDATE SET
+        user_name=EXCLUDED.user_name,
+        display_name=EXCLUDED.display_name,
+        job=EXCLUDED.job,
+        gear=EXCLUDED.gear,
+        availability=EXCLUDED.availability,
+        voice=EXCLUDED.voice,
+        note=EXCLUDED.note,
+        {team_update}
+        timestamp=EXCLUDED.timestamp,
+        updated_at=NOW()
+    RETURNING guild_id, user_id, display_name, job, team
+    )
+    INSERT INTO signup_history (guild_id, user_id, action, display_name, job, team)
+    SELECT guild_id, user_id, 'signup', display_name, job, team FROM up
+"""
+
+# 最常用的查詢：每條連線 PREPARE 一次，之後只送名稱與參數（參數一律用 %s）
+PREPARED_STATEMENTS = {
+    "get_signup": "SELECT * FROM signups WHERE guild_id=%s AND user_id=%s",
+    "upsert_signup": _UPSERT_SIGNUP.format(team_update="team=EXCLUDED.team,"),
+    # 報名回放用：已存在的成員不覆寫隊伍
+    "upsert_signup_keep_team": _UPSERT_SIGNUP.format(team_update=""),
+    # 封存的成員再次報名時先搬回來（保留原本的隊伍），接著的 upsert 再覆寫報名內容
+    "restore_signup": f"""
+        WITH restored AS (
+            DELETE FROM signups_archive WHERE guild_id=%s AND user_id=%s
+            RETURNING {", ".join(SIGNUP_COLUMNS)}
+        )
+        INSERT INTO signups ({", ".join(SIGNUP_COLUMNS)})
+        SELECT {", ".join(SIGNUP_COLUMNS)} FROM restored
+        ON CONFLICT (guild_id, user_id) DO NOTHING
+    """,
+}
+
+def _signup_params(guild_id: int, user_id: int, info: dict, default_team: str = "未分配"):
+    return (
+        guild_id, user_id,
+        info.get("user_name"),
+        info.get("display_name"),
+        info.get("job"),
+        info.get("gear"),
+        info.get("availability"),
+        info.get("voice"),
+        info.get("note"),
+        info.get("team", default_team),
+        info.get("timestamp"),
+    )
+
+def init_db():
+    with get_conn(DB_SLOW_STATEMENT_TIMEOUT_MS) as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS signups (
+                    guild_id BIGINT NOT NULL,
+                    user_id  BIGINT NOT NULL,
+                    user_name TEXT,
+                    display_name TEXT,
+                    job TEXT,
+                    gear TEXT,
+                    availability TEXT,
+                    voice TEXT,
+                    note TEXT,
+                    team TEXT DEFAULT '未分配',
+                    timestamp TEXT,
+                    updated_at TIMESTAMPTZ DEFAULT NOW(),
+                    PRIMARY KEY (guild_id, user_id)
+                );
+            """)
+
+            # 隊伍 / 報名異動紀錄（只新增不修改），依週分區 + BRIN 時間索引
+            cur.execute("SELECT to_regclass('signup_history') IS NULL;")
+            history_is_new = cur.fetchone()[0]
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS signup_history (
+                    guild_id BIGINT NOT NULL,
+                    user_id  BIGINT NOT NULL,
+                    action TEXT NOT NULL,
+                    display_name TEXT,
+                    job TEXT,
+                    team TEXT,
+                    changed_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+                ) PARTITION BY RANGE (changed_at);
+            """)
+            cur.execute("""
+                CREATE INDEX IF NOT EXISTS signup_history_changed_at_brin
+                ON signup_history USING BRIN (changed_at);
+            """)
+            _create_history_partitions(cur, datetime.now(timezone.utc))
+            if history_is_new:
+                # 第一次建立時，把現有名單記為起點，之後才能還原任一時間點的陣容
+                cur.execute("""
+                    INSERT INTO signup_history (guild_id, user_id, action, display_name, job, team)
+                    SELECT guild_id, user_id, 'baseline', display_name, job, team FROM signups;
+                """)
+
+            # 幫戰當晚的陣容快照
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS war_snapshots (
+                    snapshot_id BIGSERIAL PRIMARY KEY,
+                    guild_id BIGINT NOT NULL,
+                    label TEXT,
+                    taken_at TIMESTAMPTZ DEFAULT NOW()
+                );
+            """)
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS war_snapshot_members (
+                    snapshot_id BIGINT NOT NULL REFERENCES war_snapshots ON DELETE CASCADE,
+                    user_id BIGINT NOT NULL,
+                    display_name TEXT,
+                    job TEXT,
+                    team TEXT,
+                    PRIMARY KEY (snapshot_id, user_id)
+                );
+            """)
+            cur.execute("CREATE INDEX IF NOT EXISTS war_snapshots_guild_idx ON war_snapshots (guild_id, taken_at);")
+
+            # 太久沒更新的報名搬到這裡，signups 只留目前的名單
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS signups_archive (
+                    LIKE signups INCLUDING DEFAULTS,
+                    archived_at TIMESTAMPTZ DEFAULT NOW(),
+                    PRIMARY KEY (guild_id, user_id)
+                );
+            """)
+            cur.execute("CREATE INDEX IF NOT EXISTS signups_updated_at_idx ON signups (updated_at);")
+
+            # 每個伺服器釘選的名單摘要訊息
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS roster_digests (
+                    guild_id BIGINT PRIMARY KEY,
+                    channel_id BIGINT NOT NULL,
+                    message_id BIGINT NOT NULL,
+                    updated_at TIMESTAMPTZ DEFAULT NOW()
+                );
+            """)
+
+            # 匯出 job 的進度；網頁有多個 worker 時，查進度 / 下載的請求不一定打到建立 job 的那個
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS export_jobs (
+                    job_id TEXT PRIMARY KEY,
+                    state TEXT NOT NULL,
+                    total INTEGER NOT NULL DEFAULT 0,
+                    done INTEGER NOT NULL DEFAULT 0,
+                    rows INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    path TEXT,
+                    created_at TIMESTAMPTZ DEFAULT NOW(),
+                    finished_at TIMESTAMPTZ
+                );
+            """)
+        conn.commit()
+
+def _week_start(ts: datetime) -> datetime:
+    day = ts.astimezone(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    return day - timedelta(days=day.weekday())
+
+def _create_history_partitions(cur, now: datetime):
+    global _history_ready_until
+    start = _week_start(now)
+    for i in range(HISTORY_WEEKS_AHEAD + 1):
+        lo = start + timedelta(weeks=i)
+        hi = lo + timedelta(weeks=1)
+        cur.execute(
+            f"CREATE TABLE IF NOT EXISTS signup_history_{lo:%Y%m%d} "
+            "PARTITION OF signup_history FOR VALUES FROM (%s) TO (%s);",
+            (lo, hi),
+        )
+    _history_ready_until = start + timedelta(weeks=HISTORY_WEEKS_AHEAD + 1)
+
+def _ensure_history_partitions():
+    # 長時間執行的行程每週補建一次分區；平常不多花任何 round trip
+    now = datetime.now(timezone.utc)
+    if _history_ready_until is not None and now < _history_ready_until - timedelta(weeks=1):
+        return
+    try:
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                _create_history_partitions(cur, now)
+            conn.commit()
+    except psycopg2.Error as e:
+        # 另一個行程可能同時在建同一個分區
+        print(f"⚠️ 建立 signup_history 分區失敗：{e}")
+
+def db_upsert_signup(guild_id: int, user_id: int, info: dict):
+    _ensure_history_partitions()
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            # 同一個 statement 順便寫入異動紀錄；封存還原與 upsert 一起送出，不多一次 round trip
+            execute_prepared_batch(cur, [
+                ("restore_signup", (guild_id, user_id)),
+                ("upsert_signup", _signup_params(guild_id, user_id, info)),
+            ])
+        conn.commit()
+    note_write(guild_id, user_id)
+
+def db_upsert_signups(entries):
+    """entries: [(guild_id, user_id, info), ...]，整批一次寫入（本機暫存日誌回放用）。
+
+    同一位成員只保留最後一筆；已存在的成員不會覆寫隊伍（隊伍由管理員調整），新成員預設為未分配。
+    """
+    latest = {}
+    for guild_id, user_id, info in entries:
+        latest[(guild_id, user_id)] = info
+    if not latest:
+        return
+    rows = [
+        _signup_params(guild_id, user_id, {**info, "team": info.get("team") or "未分配"})
+        for (guild_id, user_id), info in latest.items()
+    ]
+    _ensure_history_partitions()
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            calls = []
+            for row in rows:
+                calls.append(("restore_signup", row[:2]))
+                calls.append(("upsert_signup_keep_team", row))
+            execute_prepared_batch(cur, calls)
+        conn.commit()
+    for guild_id, user_id in latest:
+        note_write(guild_id, user_id)
+
+@_stale_fallback
+def db_get_signup(guild_id: int, user_id: int):
+    with get_read_conn(guild_id, user_id) as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            execute_prepared(cur, "get_signup", (guild_id, user_id))
+            return cur.fetchone()
+
+def _select_columns(columns) -> str:
+    # 只接受白名單欄位，避免把使用者輸入拼進 SQL
+    if not columns:
+        return "*"
+    unknown = [c for c in columns if c not in SIGNUP_COLUMNS]
+    if unknown:
+        raise ValueError(f"未知的欄位：{', '.join(unknown)}")
+    return ", ".join(columns)
+
+@_stale_fallback
+def db_list_signups_by_guild(guild_id: int, columns=None):
+    with get_read_conn(guild_id) as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(
+                f"SELECT {_select_columns(columns)} FROM signups WHERE guild_id=%s ORDER BY display_name ASC;",
+                (guild_id,),
+            )
+            return cur.fetchall()
+
+@_stale_fallback
+def db_list_all_signups(columns=None):
+    with get_read_conn(statement_timeout_ms=DB_SLOW_STATEMENT_TIMEOUT_MS) as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(f"SELECT {_select_columns(columns)} FROM signups ORDER BY guild_id ASC, display_name ASC;")
+            return cur.fetchall()
+
+@_stale_fallback
+def db_list_guild_ids():
+    with get_read_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT DISTINCT guild_id FROM signups ORDER BY guild_id ASC;")
+            return [r[0] for r in cur.fetchall()]
+
+def db_page_signups(guild_id: int, columns=None, teams=None, after_user_id=None, limit: int = 100):
+    """依 user_id 做 keyset 分頁（走主鍵索引），回傳 (rows, 下一頁的 after_user_id 或 None)。"""
+    columns = list(columns or SIGNUP_COLUMNS)
+    if "user_id" not in columns:
+        columns.append("user_id")
+    where, params = _roster_filter(guild_id, teams=teams)
+    if after_user_id is not None:
+        where += " AND user_id > %s"
+        params.append(after_user_id)
+    with get_read_conn(guild_id) as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(
+                f"SELECT {_select_columns(columns)} FROM signups WHERE {where} ORDER BY user_id ASC LIMIT %s;",
+                [*params, limit + 1],
+            )
+            rows = cur.fetchall()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, rows[-1]["user_id"]
+    return rows, None
+
+def db_update_team(guild_id: int, user_id: int, team: str):
+    db_update_teams([(guild_id, user_id, team)])
+
+def db_update_teams(changes):
+    """changes: [(guild_id, user_id, team), ...]，整批一次送出，只寫入真的有變動的成員。"""
+    changes = list(changes)
+    if not changes:
+        return
+    _ensure_history_partitions()
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            execute_values(cur, """
+                WITH v (guild_id, user_id, team) AS (VALUES %s),
+                upd AS (
+                    UPDATE signups s SET team=v.team, updated_at=NOW()
+                    FROM v
+                    WHERE s.guild_id=v.guild_id AND s.user_id=v.user_id
+                      AND s.team IS DISTINCT FROM v.team
+                    RETURNING s.guild_id, s.user_id, s.display_name, s.job, s.team
+                )
+                INSERT INTO signup_history (guild_id, user_id, action, display_name, job, team)
+                SELECT guild_id, user_id, 'team', display_name, job, team FROM upd;
+            """, changes, template="(%s::bigint, %s::bigint, %s::text)", page_size=1000)
+        conn.commit()
+    for guild_id, user_id, _ in changes:
+        note_write(guild_id, user_id)
+
+def _roster_filter(guild_id: int, teams=None, exclude_teams=None, jobs=None, updated_before=None):
+    clauses = ["guild_id=%s"]
+    params = [guild_id]
+    if teams:
+        clauses.append("COALESCE(team, '未分配') = ANY(%s)")
+        params.append(list(teams))
+    if exclude_teams:
+        clauses.append("COALESCE(team, '未分配') <> ALL(%s)")
+        params.append(list(exclude_teams))
+    if jobs:
+        clauses.append("job = ANY(%s)")
+        params.append(list(jobs))
+    if updated_before is not None:
+        clauses.append("updated_at < %s")
+        params.append(updated_before)
+    return " AND ".join(clauses), params
+
+def db_bulk_set_team(guild_id: int, to_team: str, teams=None, exclude_teams=None, jobs=None, updated_before=None) -> int:
+    """一個 UPDATE 把符合條件的成員全部改到 to_team，回傳實際異動人數。"""
+    if to_team not in TEAMS:
+        raise ValueError(f"未知的隊伍：{to_team}")
+    _ensure_history_partitions()
+    where, params = _roster_filter(guild_id, teams, exclude_teams, jobs, updated_before)
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                WITH upd AS (
+                    UPDATE signups SET team=%s, updated_at=NOW()
+                    WHERE {where} AND team IS DISTINCT FROM %s
+                    RETURNING guild_id, user_id, display_name, job, team
+                ),
+                h AS (
+                    INSERT INTO signup_history (guild_id, user_id, action, display_name, job, team)
+                    SELECT guild_id, user_id, 'team', display_name, job, team FROM upd
+                )
+                SELECT COUNT(*) FROM upd;
+            """, [to_team, *params, to_team])
+            count = cur.fetchone()[0]
+        conn.commit()
+    note_write(guild_id)
+    return count
+
+def db_bulk_delete_signups(guild_id: int, teams=None, exclude_teams=None, jobs=None, updated_before=None) -> int:
+    """一個 DELETE 清除符合條件的報名（例如賽季結束清空名單），回傳刪除人數。
+
+    封存區裡符合同樣條件的報名也一起刪掉，否則成員再次報名時會帶著上一季的隊伍被搬回來。
+    """
+    _ensure_history_partitions()
+    where, params = _roster_filter(guild_id, teams, exclude_teams, jobs, updated_before)
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                WITH del AS (
+                    DELETE FROM signups WHERE {where}
+                    RETURNING guild_id, user_id, display_name, job
+                ),
+                arch AS (
+                    DELETE FROM signups_archive WHERE {where}
+                ),
+                h AS (
+                    INSERT INTO signup_history (guild_id, user_id, action, display_name, job, team)
+                    SELECT guild_id, user_id, 'delete', display_name, job, NULL FROM del
+                )
+                SELECT COUNT(*) FROM del;
+            """, params * 2)
+            count = cur.fetchone()[0]
+        conn.commit()
+    note_write(guild_id)
+    return count
+
+def db_archive_stale_signups(older_than_days: int, batch_size: int = ARCHIVE_BATCH_SIZE, pause: float = 0.1) -> int:
+    """把 updated_at 超過 older_than_days 天的報名搬到 signups_archive，回傳搬移筆數。
+
+    每批各自 commit，且用 SKIP LOCKED 跳過正在被寫入的列，不會長時間鎖住名單。
+    """
+    columns = ", ".join(SIGNUP_COLUMNS)
+    updates = ", ".join(f"{c}=EXCLUDED.{c}" for c in SIGNUP_COLUMNS[2:])
+    _ensure_history_partitions()
+    total = 0
+    while True:
+        with get_conn(DB_SLOW_STATEMENT_TIMEOUT_MS) as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"""
+                    WITH moved AS (
+                        DELETE FROM signups WHERE ctid = ANY(ARRAY(
+                            SELECT ctid FROM signups
+                            WHERE updated_at < NOW() - %s * INTERVAL '1 day'
+                            LIMIT %s
+                            FOR UPDATE SKIP LOCKED
+                        ))
+                        RETURNING {columns}
+                    ),
+                    h AS (
+                        INSERT INTO signup_history (guild_id, user_id, action, display_name, job, team)
+                        SELECT guild_id, user_id, 'archive', display_name, job, team FROM moved
+                    )
+                    INSERT INTO signups_archive ({columns}, archived_at)
+                    SELECT {columns}, NOW() FROM moved
+                    ON CONFLICT (guild_id, user_id) DO UPDATE SET {updates}, archived_at=NOW();
+                """, (older_than_days, batch_size))
+                moved = cur.rowcount
+            conn.commit()
+        total += moved
+        if moved < batch_size:
+            return total
+        time.sleep(pause)
+
+def db_snapshot_lineup(guild_id: int, label: str = ""):
+    """把目前陣容凍結成一份快照（伺服器端一次 INSERT ... SELECT），回傳 (snapshot_id, 人數)。"""
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                WITH s AS (
+                    INSERT INTO war_snapshots (guild_id, label) VALUES (%s, %s)
+                    RETURNING snapshot_id
+                ),
+                m AS (
+                    INSERT INTO war_snapshot_members (snapshot_id, user_id, display_name, job, team)
+                    SELECT s.snapshot_id, x.user_id, x.display_name, x.job, x.team
+                    FROM signups x, s
+                    WHERE x.guild_id=%s
+                    RETURNING 1
+                )
+                SELECT (SELECT snapshot_id FROM s), (SELECT COUNT(*) FROM m);
+            """, (guild_id, label, guild_id))
+            snapshot_id, count = cur.fetchone()
+        conn.commit()
+    note_write(guild_id)
+    return snapshot_id, count
+
+@_stale_fallback
+def db_list_snapshots(guild_id: int):
+    with get_read_conn(guild_id) as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("""
+                SELECT s.snapshot_id, s.label, s.taken_at, COUNT(m.user_id) AS member_count
+                FROM war_snapshots s
+                LEFT JOIN war_snapshot_members m ON m.snapshot_id = s.snapshot_id
+                WHERE s.guild_id=%s
+                GROUP BY s.snapshot_id
+                ORDER BY s.taken_at DESC;
+            """, (guild_id,))
+            return cur.fetchall()
+
+def db_get_snapshot_members(snapshot_id: int):
+    with get_read_conn() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("""
+                SELECT user_id, display_name, job, team FROM war_snapshot_members
+                WHERE snapshot_id=%s ORDER BY team ASC, display_name ASC;
+            """, (snapshot_id,))
+            return cur.fetchall()
+
+def db_compare_snapshot(guild_id: int, snapshot_id: int):
+    """快照與目前名單比較，只回傳隊伍不同（含新加入 / 已不在名單）的成員；快照不屬於該伺服器時回傳 None。"""
+    with get_read_conn(guild_id) as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("SELECT 1 FROM war_snapshots WHERE snapshot_id=%s AND guild_id=%s;", (snapshot_id, guild_id))
+            if cur.fetchone() is None:
+                return None
+            cur.execute("""
+                SELECT COALESCE(s.user_id, m.user_id) AS user_id,
+                       COALESCE(s.display_name, m.display_name) AS display_name,
+                       m.team AS snapshot_team,
+                       s.team AS current_team
+                FROM (SELECT * FROM war_snapshot_members WHERE snapshot_id=%s) m
+                FULL JOIN (SELECT * FROM signups WHERE guild_id=%s) s ON s.user_id = m.user_id
+                WHERE m.team IS DISTINCT FROM s.team
+                ORDER BY display_name ASC;
+            """, (snapshot_id, guild_id))
+            return cur.fetchall()
+
+def db_lineup_at(guild_id: int, at: datetime):
+    """由異動紀錄還原某個時間點的陣容。"""
+    with get_read_conn(guild_id) as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("""
+                SELECT * FROM (
+                    SELECT DISTINCT ON (user_id) user_id, display_name, job, team, action
+                    FROM signup_history
+                    WHERE guild_id=%s AND changed_at <= %s
+                    ORDER BY user_id, changed_at DESC
+                ) last
+                WHERE action NOT IN ('delete', 'archive')
+                ORDER BY team ASC, display_name ASC;
+            """, (guild_id, at))
+            return cur.fetchall()
+
+def db_changed_guilds_since(since):
+    """從異動紀錄找出 since 之後有變動的伺服器（BRIN 索引只掃最近的區塊）。
+
+    回傳 (rows, 資料庫目前時間)，rows 為 [(guild_id, 最後異動時間, 異動筆數), ...]。
+    """
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT NOW();")
+            now = cur.fetchone()[0]
+            if since is None:
+                return [], now
+            cur.execute("""
+                SELECT guild_id, MAX(changed_at), COUNT(*) FROM signup_history
+                WHERE changed_at > %s
+                GROUP BY guild_id;
+            """, (since,))
+            return cur.fetchall(), now
+
+def db_set_roster_digest(guild_id: int, channel_id: int, message_id: int):
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO roster_digests (guild_id, channel_id, message_id, updated_at)
+                VALUES (%s,%s,%s,NOW())
+                ON CONFLICT (guild_id) DO UPDATE SET
+                    channel_id=EXCLUDED.channel_id,
+                    message_id=EXCLUDED.message_id,
+                    updated_at=NOW();
+            """, (guild_id, channel_id, message_id))
+        conn.commit()
+
+@_stale_fallback
+def db_list_roster_digests():
+    with get_conn() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("SELECT guild_id, channel_id, message_id FROM roster_digests;")
+            return cur.fetchall()
+
+def db_delete_roster_digest(guild_id: int):
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM roster_digests WHERE guild_id=%s;", (guild_id,))
+        conn.commit()
+
+def db_save_export_job(job_id: str, state: str, total: int, done: int, rows: int, error=None, path=None, finished: bool = False):
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO export_jobs (job_id, state, total, done, rows, error, path, finished_at)
+                VALUES (%s,%s,%s,%s,%s,%s,%s, CASE WHEN %s THEN NOW() END)
+                ON CONFLICT (job_id) DO UPDATE SET
+                    state=EXCLUDED.state,
+                    total=EXCLUDED.total,
+                    done=EXCLUDED.done,
+                    rows=EXCLUDED.rows,
+                    error=EXCLUDED.error,
+                    path=EXCLUDED.path,
+                    finished_at=EXCLUDED.finished_at;
+            """, (job_id, state, total, done, rows, error, path, finished))
+        conn.commit()
+
+def db_get_export_job(job_id: str):
+    # 進度要看最新的，一律讀主庫
+    with get_conn() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("SELECT * FROM export_jobs WHERE job_id=%s;", (job_id,))
+            return cur.fetchone()
+
+def db_delete_export_jobs(older_than_seconds: float):
+    """刪除建立 / 完成超過 older_than_seconds 秒的匯出 job，回傳它們的檔案路徑。"""
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                DELETE FROM export_jobs
+                WHERE COALESCE(finished_at, created_at) < NOW() - %s * INTERVAL '1 second'
+                RETURNING path;
+            """, (older_than_seconds,))
+            paths = [r[0] for r in cur.fetchall() if r[0]]
+        conn.commit()
+    return paths
@@ -0,0 +1,175 @@
+import io
+import os
+import time
+import uuid
+import zipfile
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import psycopg2
+
+from core.db import (
+    db_list_guild_ids, db_list_signups_by_guild, DB_POOL_SIZE,
+    db_save_export_job, db_get_export_job, db_delete_export_jobs,
+)
+
+CSV_HEADERS = ["UserID", "顯示名稱", "職業流派", "裝備境界", "可出席時段", "語音狀況", "隊伍", "備註", "最後更新時間"]
+# 匯出只需要這些欄位
+CSV_COLUMNS = ["user_id", "display_name", "job", "gear", "availability", "voice", "team", "note", "timestamp"]
+
+# 匯出和 bot 背景工作共用同一個連線池，至少留兩條連線給其他查詢；多個匯出同時跑也共用這個上限
+EXPORT_WORKERS = max(1, min(int(os.environ.get("EXPORT_WORKERS", "4")), DB_POOL_SIZE - 2))
+_export_slots = threading.BoundedSemaphore(EXPORT_WORKERS)
+# 完成的匯出檔保留多久（秒）
+EXPORT_KEEP_SECONDS = 3600
+# zip 放這裡；網頁跑在多台機器上時要指到共用的目錄，其他 worker 才下載得到
+EXPORT_DIR = os.environ.get("EXPORT_DIR") or tempfile.gettempdir()
+# 進度最多每隔這麼久寫回資料庫一次
+EXPORT_PROGRESS_SECONDS = 1.0
+
+def _cell(value) -> str:
+    return (value or "").replace("\n", " ").replace(",", "，")
+
+def signups_to_csv(rows) -> bytes:
+    output = io.StringIO()
+    output.write(",".join(CSV_HEADERS) + "\n")
+    for info in rows:
+        row = [
+            str(info["user_id"]),
+            _cell(info.get("display_name")),
+            _cell(info.get("job")),
+            _cell(info.get("gear")),
+            _cell(info.get("availability")),
+            _cell(info.get("voice")),
+            _cell(info.get("team") or "未分配"),
+            _cell(info.get("note")),
+            info.get("timestamp") or "",
+        ]
+        output.write(",".join(row) + "\n")
+    return output.getvalue().encode("utf-8")
+
+def export_guild_csv(guild_id: int) -> bytes:
+    return signups_to_csv(db_list_signups_by_guild(guild_id, CSV_COLUMNS))
+
+def _export_guild_limited(guild_id: int) -> bytes:
+    with _export_slots:
+        return export_guild_csv(guild_id)
+
+class ExportJob:
+    """多伺服器匯出：各伺服器的 CSV 在 worker pool 產生，完成一個就寫進同一個 zip。"""
+
+    def __init__(self, guild_ids=None):
+        self.id = uuid.uuid4().hex
+        self.guild_ids = list(guild_ids) if guild_ids else None
+        self.state = "pending"
+        self.total = 0
+        self.done = 0
+        self.rows = 0
+        self.error = None
+        self.path = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self._saved_at = 0.0
+
+    @classmethod
+    def from_row(cls, row):
+        """其他 worker 建立的 job：從 export_jobs 還原（只用來查進度 / 下載）。"""
+        job = cls()
+        job.id = row["job_id"]
+        job.state = row["state"]
+        job.total = row["total"]
+        job.done = row["done"]
+        job.rows = row["rows"]
+        job.error = row["error"]
+        job.path = row["path"]
+        job.created_at = row["created_at"].timestamp()
+        job.finished_at = row["finished_at"].timestamp() if row["finished_at"] else None
+        return job
+
+    def save(self, force: bool = False):
+        """把進度寫進 export_jobs，讓每個 worker 都查得到；資料庫暫時寫不進去不影響匯出本身。"""
+        now = time.monotonic()
+        if not force and now - self._saved_at < EXPORT_PROGRESS_SECONDS:
+            return
+        self._saved_at = now
+        try:
+            db_save_export_job(
+                self.id, self.state, self.total, self.done, self.rows,
+                self.error, self.path, finished=self.finished_at is not None,
+            )
+        except psycopg2.Error as e:
+            print(f"⚠️ 匯出進度寫入資料庫失敗（{self.id}）：{e}")
+
+    def progress(self) -> dict:
+        return {
+            "id": self.id,
+            "state": self.state,
+            "total": self.total,
+            "done": self.done,
+            "error": self.error,
+        }
+
+    def run(self):
+        self.state = "running"
+        fd, path = tempfile.mkstemp(prefix="signups-", suffix=".zip", dir=EXPORT_DIR)
+        os.close(fd)
+        try:
+            guild_ids = self.guild_ids or db_list_guild_ids()
+            self.total = len(guild_ids)
+            with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as zf, \
+                    ThreadPoolExecutor(EXPORT_WORKERS) as pool:
+                futures = {pool.submit(_export_guild_limited, gid): gid for gid in guild_ids}
+                # zip 只在這個 thread 寫入
+                for future in as_completed(futures):
+                    data = future.result()
+                    zf.writestr(f"signups_{futures[future]}.csv", data)
+                    self.rows += data.count(b"\n") - 1
+                    self.done += 1
+                    self.save()
+            self.path = path
+            self.state = "done"
+        except Exception as e:
+            os.remove(path)
+            self.error = str(e)
+            self.state = "failed"
+        finally:
+            self.finished_at = time.time()
+            self.save(force=True)
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+def start_export(guild_ids=None) -> ExportJob:
+    """在背景 thread 開始匯出，立即回傳 job（用 get_export(job.id) 查進度）。"""
+    _cleanup_exports()
+    job = ExportJob(guild_ids)
+    # 先寫一筆，redirect 到進度頁時不管打到哪個 worker 都找得到
+    job.save(force=True)
+    with _jobs_lock:
+        _jobs[job.id] = job
+    threading.Thread(target=job.run, name=f"export-{job.id}", daemon=True).start()
+    return job
+
+def get_export(job_id: str):
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if job is not None:
+        return job
+    row = db_get_export_job(job_id)
+    return ExportJob.from_row(row) if row else None
+
+def _cleanup_exports():
+    cutoff = time.time() - EXPORT_KEEP_SECONDS
+    with _jobs_lock:
+        expired = [j for j in _jobs.values() if j.finished_at and j.finished_at < cutoff]
+        for job in expired:
+            _jobs.pop(job.id, None)
+    paths = {job.path for job in expired if job.path}
+    try:
+        paths.update(db_delete_export_jobs(EXPORT_KEEP_SECONDS))
+    except psycopg2.Error as e:
+        print(f"⚠️ 清除過期的匯出 job 失敗：{e}")
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
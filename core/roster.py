@@ -0,0 +1,25 @@
+TEAMS = ["進攻1", "進攻2", "防守", "替補", "請假", "未分配"]
+
+TEAM_CLASSES = {
+    "進攻1": "team-off1",
+    "進攻2": "team-off2",
+    "防守": "team-def",
+    "替補": "team-sub",
+    "請假": "team-leave",
+    "未分配": "team-unassigned",
+}
+
+def normalize_team(team) -> str:
+    """空白或不認得的隊伍一律視為未分配。"""
+    return team if team in TEAM_CLASSES else "未分配"
+
+def group_by_team(rows):
+    """依 TEAMS 順序分組，回傳 {隊伍: [row, ...]}。"""
+    blocks = {t: [] for t in TEAMS}
+    for r in rows:
+        blocks[normalize_team(r.get("team"))].append(r)
+    return blocks
+
+# /signup 自動完成的基本選項（再加上伺服器內已經有人填過的值）
+CANONICAL_JOBS = ["碎夢", "鐵衣", "血河", "神相", "素問", "九靈", "龍吟", "潮光", "玄機"]
+CANONICAL_VOICES = ["可講話", "只聽指揮", "無法語音"]
@@ -0,0 +1,132 @@
+import os
+import time
+import asyncio
+
+import discord
+
+from core.db import db_list_signups_by_guild
+from core.roster import TEAMS
+
+# 隊伍 → 身分組同步：身分組名稱與隊伍名稱相同（進攻1、防守…）就會被管理
+ROLE_SYNC_ENABLED = os.environ.get("ROLE_SYNC_ENABLED", "") == "1"
+# 整個 bot 每秒最多送出幾次成員修改（discord.py 也會依各路由的 bucket 自動等待）
+ROLE_SYNC_RATE = float(os.environ.get("ROLE_SYNC_RATE", "5"))
+ROLE_SYNC_WORKERS = 2
+ROLE_SYNC_DEBOUNCE_SECONDS = 3.0
+ROLE_SYNC_MAX_RETRIES = 3
+
+class _RateLimiter:
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+class RoleSync:
+    """比對每個伺服器的 team 欄位與成員身分組，只送出最少的增減，並透過限速佇列套用。"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self._queue = asyncio.Queue()
+        self._desired = {}   # (guild_id, member_id) -> 應有的隊伍身分組 id（set）
+        self._pending = {}   # guild_id -> 延遲中的比對 task
+        self._limiter = _RateLimiter(ROLE_SYNC_RATE)
+        self._workers = []
+
+    def start(self):
+        for _ in range(ROLE_SYNC_WORKERS):
+            self._workers.append(asyncio.create_task(self._worker()))
+
+    def mark_dirty(self, guild_ids):
+        for guild_id in guild_ids:
+            if guild_id not in self._pending:
+                self._pending[guild_id] = asyncio.create_task(self._sync_later(guild_id))
+
+    async def _sync_later(self, guild_id: int):
+        try:
+            await asyncio.sleep(ROLE_SYNC_DEBOUNCE_SECONDS)
+            self._pending.pop(guild_id, None)
+            await self.sync_guild(guild_id)
+        except Exception as e:
+            print(f"⚠️ 身分組比對失敗（guild {guild_id}）：{e}")
+        finally:
+            if self._pending.get(guild_id) is asyncio.current_task():
+                self._pending.pop(guild_id, None)
+
+    @staticmethod
+    def team_roles(guild: discord.Guild):
+        return {r.name: r for r in guild.roles if r.name in TEAMS and not r.managed}
+
+    async def sync_guild(self, guild_id: int) -> int:
+        """計算差異並排入佇列，回傳需要修改的成員數。"""
+        guild = self.bot.get_guild(guild_id)
+        if guild is None:
+            return 0
+        roles = self.team_roles(guild)
+        if not roles:
+            return 0
+        if not guild.chunked:
+            await guild.chunk()
+
+        managed = {r.id for r in roles.values()}
+        rows = await asyncio.to_thread(db_list_signups_by_guild, guild_id, ["user_id", "team"])
+        want = {r["user_id"]: {roles[r["team"]].id} if r.get("team") in roles else set() for r in rows}
+
+        queued = 0
+        for member in guild.members:
+            current = {r.id for r in member.roles} & managed
+            desired = want.get(member.id, set())
+            if current == desired:
+                continue
+            key = (guild_id, member.id)
+            if key not in self._desired:
+                self._queue.put_nowait(key)
+            # 已在佇列中的成員只更新目標狀態，不會重複送出
+            self._desired[key] = desired
+            queued += 1
+        return queued
+
+    async def _worker(self):
+        while True:
+            key = await self._queue.get()
+            try:
+                await self._apply(key)
+            except Exception as e:
+                print(f"⚠️ 身分組同步失敗（{key}）：{e}")
+            finally:
+                self._queue.task_done()
+
+    async def _apply(self, key):
+        guild_id, member_id = key
+        desired = self._desired.pop(key, None)
+        guild = self.bot.get_guild(guild_id)
+        member = guild.get_member(member_id) if guild else None
+        if desired is None or member is None:
+            return
+
+        managed = {r.id for r in self.team_roles(guild).values()}
+        keep = [r for r in member.roles if not r.is_default() and r.id not in managed]
+        new_roles = keep + [guild.get_role(rid) for rid in desired if guild.get_role(rid)]
+        if {r.id for r in new_roles} == {r.id for r in member.roles if not r.is_default()}:
+            return
+
+        for attempt in range(ROLE_SYNC_MAX_RETRIES + 1):
+            await self._limiter.wait()
+            try:
+                # 加與移除合成一次 API 呼叫
+                await member.edit(roles=new_roles, reason="幫戰隊伍同步")
+                return
+            except discord.Forbidden:
+                print(f"⚠️ 沒有權限修改 {member} 的身分組（bot 身分組需高於隊伍身分組）")
+                return
+            except discord.HTTPException as e:
+                if (e.status < 500 and e.status != 429) or attempt == ROLE_SYNC_MAX_RETRIES:
+                    raise
+                await asyncio.sleep(2 ** attempt)
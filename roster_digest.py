@@ -0,0 +1,106 @@
+import asyncio
+
+import discord
+
+from core.db import (
+    db_list_signups_by_guild, db_list_roster_digests,
+    db_set_roster_digest, db_delete_roster_digest,
+)
+from core.roster import TEAMS, group_by_team
+
+# 一連串異動只編輯一次訊息
+DIGEST_DEBOUNCE_SECONDS = 5.0
+# embed 總長上限 6000 字，六個欄位各留一點空間
+FIELD_MAX_CHARS = 950
+
+def render_roster(rows):
+    """依六個隊伍分組，回傳 (總人數, [(欄位名稱, 內容), ...])。"""
+    blocks = group_by_team(rows)
+    fields = []
+    for team in TEAMS:
+        names = [f"{r.get('display_name') or '（無名）'}・{r.get('job') or '？'}" for r in blocks[team]]
+        value = ""
+        for i, line in enumerate(names):
+            more = f"\n…等 {len(names) - i} 人"
+            if len(value) + len(line) + 1 + len(more) > FIELD_MAX_CHARS:
+                value += more
+                break
+            value += ("\n" if value else "") + line
+        fields.append((f"{team}（{len(names)}）", value or "（無）"))
+    return len(rows), fields
+
+def build_roster_embed(roster) -> discord.Embed:
+    total, fields = roster
+    embed = discord.Embed(title="⚔ 幫戰名單", description=f"總人數：**{total}**", color=0x00d1c4)
+    for name, value in fields:
+        embed.add_field(name=name, value=value, inline=True)
+    embed.set_footer(text="名單異動時會自動更新")
+    return embed
+
+class RosterDigest:
+    """每個伺服器一則釘選的名單訊息；收到異動後延遲合併，只在欄位有變時才編輯訊息。"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self._targets = {}   # guild_id -> (channel_id, message_id)
+        self._rendered = {}  # guild_id -> 上次送出的 (總人數, 欄位)
+        self._pending = {}   # guild_id -> 延遲中的更新 task
+
+    async def load(self):
+        for d in await asyncio.to_thread(db_list_roster_digests):
+            self._targets[d["guild_id"]] = (d["channel_id"], d["message_id"])
+
+    async def fetch_roster(self, guild_id: int):
+        rows = await asyncio.to_thread(db_list_signups_by_guild, guild_id, ["display_name", "job", "team"])
+        return render_roster(rows)
+
+    async def pin(self, channel: discord.abc.Messageable, guild_id: int) -> discord.Message:
+        roster = await self.fetch_roster(guild_id)
+        message = await channel.send(embed=build_roster_embed(roster))
+        try:
+            await message.pin()
+        except discord.HTTPException:
+            pass  # 沒有管理訊息權限時仍然可以正常更新，只是不會釘選
+        await asyncio.to_thread(db_set_roster_digest, guild_id, channel.id, message.id)
+        self._targets[guild_id] = (channel.id, message.id)
+        self._rendered[guild_id] = roster
+        return message
+
+    def mark_dirty(self, guild_ids):
+        for guild_id in guild_ids:
+            if guild_id in self._targets and guild_id not in self._pending:
+                self._pending[guild_id] = asyncio.create_task(self._refresh_later(guild_id))
+
+    async def _refresh_later(self, guild_id: int):
+        try:
+            await asyncio.sleep(DIGEST_DEBOUNCE_SECONDS)
+            # 從這裡開始的異動會排下一次更新
+            self._pending.pop(guild_id, None)
+            await self.refresh(guild_id)
+        except Exception as e:
+            print(f"⚠️ 更新名單摘要失敗（guild {guild_id}）：{e}")
+        finally:
+            if self._pending.get(guild_id) is asyncio.current_task():
+                self._pending.pop(guild_id, None)
+
+    async def refresh(self, guild_id: int):
+        target = self._targets.get(guild_id)
+        if target is None:
+            return
+        roster = await self.fetch_roster(guild_id)
+        if self._rendered.get(guild_id) == roster:
+            return  # 沒有任何欄位變動，不呼叫 Discord API
+
+        channel_id, message_id = target
+        channel = self.bot.get_channel(channel_id)
+        if channel is None:
+            channel = await self.bot.fetch_channel(channel_id)
+        try:
+            await channel.get_partial_message(message_id).edit(embed=build_roster_embed(roster))
+        except discord.NotFound:
+            # 訊息被刪掉就停止追蹤
+            self._targets.pop(guild_id, None)
+            self._rendered.pop(guild_id, None)
+            await asyncio.to_thread(db_delete_roster_digest, guild_id)
+            return
+        self._rendered[guild_id] = roster
@@ -0,0 +1,151 @@
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import threading
+
+import psycopg2
+
+from core.db import db_upsert_signups
+
+# 本機只新增的報名日誌：/signup 先寫這裡就回覆，背景再批次回放到 Postgres
+JOURNAL_PATH = os.environ.get("SIGNUP_JOURNAL_PATH", "signup_journal.sqlite3")
+REPLAY_BATCH_SIZE = int(os.environ.get("SIGNUP_JOURNAL_BATCH", "200"))
+REPLAY_IDLE_SECONDS = 5.0
+REPLAY_MAX_BACKOFF_SECONDS = 60.0
+
+_lock = threading.Lock()
+_conn = None
+
+def _get_journal():
+    global _conn
+    if _conn is None:
+        conn = sqlite3.connect(JOURNAL_PATH, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL;")
+        # 每次 commit 都 fsync，機器重開也不會掉資料
+        conn.execute("PRAGMA synchronous=FULL;")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS journal (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                guild_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                info TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+        """)
+        # 資料本身有問題、重試也不會成功的報名搬到這裡，不擋住後面的回放
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS journal_dead (
+                seq INTEGER PRIMARY KEY,
+                guild_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                info TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                error TEXT NOT NULL,
+                failed_at REAL NOT NULL
+            );
+        """)
+        _conn = conn
+    return _conn
+
+def journal_append(guild_id: int, user_id: int, info: dict):
+    with _lock:
+        _get_journal().execute(
+            "INSERT INTO journal (guild_id, user_id, info, created_at) VALUES (?,?,?,?);",
+            (guild_id, user_id, json.dumps(info, ensure_ascii=False), time.time()),
+        )
+
+def journal_latest(guild_id: int, user_id: int):
+    """尚未回放到資料庫的最新一筆，沒有則回傳 None。"""
+    with _lock:
+        row = _get_journal().execute(
+            "SELECT info FROM journal WHERE guild_id=? AND user_id=? ORDER BY seq DESC LIMIT 1;",
+            (guild_id, user_id),
+        ).fetchone()
+    return json.loads(row[0]) if row else None
+
+def journal_backlog() -> int:
+    with _lock:
+        return _get_journal().execute("SELECT COUNT(*) FROM journal;").fetchone()[0]
+
+def journal_dead_letters() -> int:
+    with _lock:
+        return _get_journal().execute("SELECT COUNT(*) FROM journal_dead;").fetchone()[0]
+
+def _is_connectivity_error(e: Exception) -> bool:
+    # 連不上 / 逾時 / 斷線才值得整批重試，其他錯誤重試幾次都一樣
+    return isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError))
+
+def _dead_letter(row, error: Exception):
+    seq, gid, uid, info = row
+    print(f"🚫 報名日誌第 {seq} 筆（guild {gid}, user {uid}）無法寫入資料庫，已移到 journal_dead：{error}")
+    with _lock:
+        conn = _get_journal()
+        conn.execute("BEGIN;")
+        conn.execute(
+            "INSERT OR REPLACE INTO journal_dead (seq, guild_id, user_id, info, created_at, error, failed_at) "
+            "SELECT seq, guild_id, user_id, info, created_at, ?, ? FROM journal WHERE seq=?;",
+            (str(error), time.time(), seq),
+        )
+        conn.execute("DELETE FROM journal WHERE seq=?;", (seq,))
+        conn.execute("COMMIT;")
+
+def _replay_one_by_one(rows):
+    # 整批失敗但不是連線問題：逐筆回放找出壞掉的那幾筆，其餘照常寫入
+    for row in rows:
+        seq, gid, uid, info = row
+        try:
+            db_upsert_signups([(gid, uid, json.loads(info))])
+        except Exception as e:
+            if _is_connectivity_error(e):
+                raise
+            _dead_letter(row, e)
+            continue
+        with _lock:
+            _get_journal().execute("DELETE FROM journal WHERE seq=?;", (seq,))
+
+def journal_drain(batch_size: int = REPLAY_BATCH_SIZE) -> int:
+    """回放一批到 Postgres，成功後才從日誌刪除；回傳處理筆數。
+
+    資料庫連線失敗時直接拋出例外（整批留著下次重試）；個別報名資料有問題時移到 journal_dead。
+    """
+    with _lock:
+        rows = _get_journal().execute(
+            "SELECT seq, guild_id, user_id, info FROM journal ORDER BY seq ASC LIMIT ?;",
+            (batch_size,),
+        ).fetchall()
+    if not rows:
+        return 0
+
+    try:
+        db_upsert_signups([(gid, uid, json.loads(info)) for _, gid, uid, info in rows])
+    except Exception as e:
+        if _is_connectivity_error(e):
+            raise
+        _replay_one_by_one(rows)
+        return len(rows)
+
+    with _lock:
+        _get_journal().execute("DELETE FROM journal WHERE seq <= ?;", (rows[-1][0],))
+    return len(rows)
+
+async def replay_journal_forever(wake: asyncio.Event):
+    backoff = REPLAY_IDLE_SECONDS
+    while True:
+        try:
+            await asyncio.wait_for(wake.wait(), timeout=REPLAY_IDLE_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        wake.clear()
+
+        try:
+            while await asyncio.to_thread(journal_drain) > 0:
+                pass
+            backoff = REPLAY_IDLE_SECONDS
+        except Exception as e:
+            # 資料庫不通時退避重試，期間新的報名照樣寫進日誌
+            backoff = min(backoff * 2, REPLAY_MAX_BACKOFF_SECONDS)
+            backlog = await asyncio.to_thread(journal_backlog)
+            print(f"⚠️ 報名日誌回放失敗（剩 {backlog} 筆，{backoff:.0f} 秒後重試）：{e}")
+            await asyncio.sleep(backoff)
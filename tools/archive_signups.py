@@ -0,0 +1,26 @@
+"""手動（或用 cron）封存太久沒更新的報名：
+
+    python tools/archive_signups.py --days 90
+
+被封存的成員下次 /signup 時會自動搬回名單，並保留原本的隊伍。
+"""
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.db import init_db, db_archive_stale_signups, ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS or 90, help="超過幾天未更新就封存")
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    init_db()
+    moved = db_archive_stale_signups(args.days, args.batch_size)
+    print(f"已封存 {moved} 筆超過 {args.days} 天未更新的報名。")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""比較 prepared statement 與每次送完整 SQL 的延遲（寫入尖峰時的 db_upsert_signup / db_get_signup）。
+
+    python tools/bench_prepared.py --calls 2000 --threads 4
+
+資料會寫到 --guild-id 指定的伺服器（預設是不存在的測試 ID），結束後刪除。
+若資料庫有載入 pg_stat_statements，另外列出伺服器端的 plan / 執行時間。
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import db
+
+def server_stats():
+    """回傳 (plan ms, exec ms)；沒有 pg_stat_statements 時回傳 None。"""
+    try:
+        with db.get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT COALESCE(SUM(total_plan_time), 0), COALESCE(SUM(total_exec_time), 0)
+                    FROM pg_stat_statements WHERE query ILIKE '%signups%';
+                """)
+                return cur.fetchone()
+    except Exception:
+        return None
+
+def run(mode: str, args):
+    db.DB_PREPARED_STATEMENTS = mode == "prepared"
+    # 換掉連線池，prepared 狀態從零開始
+    db._pools.clear()
+
+    def one(i: int):
+        user_id = i % args.users
+        t0 = time.perf_counter()
+        db.db_upsert_signup(args.guild_id, user_id, {
+            "display_name": f"bench{user_id}", "job": "碎夢", "gear": str(i), "availability": "週三",
+            "voice": "可講話", "note": "", "timestamp": str(i),
+        })
+        t1 = time.perf_counter()
+        db.db_get_signup(args.guild_id, user_id)
+        t2 = time.perf_counter()
+        return t1 - t0, t2 - t1
+
+    before = server_stats()
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as pool:
+        results = list(pool.map(one, range(args.calls)))
+    elapsed = time.perf_counter() - t0
+    after = server_stats()
+
+    upsert = sorted(r[0] * 1000 for r in results)
+    get = sorted(r[1] * 1000 for r in results)
+    line = (
+        f"{mode:<10}{len(results) / elapsed:>9.0f}"
+        f"{statistics.median(upsert):>10.2f}{upsert[int(len(upsert) * 0.95)]:>10.2f}"
+        f"{statistics.median(get):>10.2f}{get[int(len(get) * 0.95)]:>10.2f}"
+    )
+    if before and after:
+        line += f"{after[0] - before[0]:>12.1f}{after[1] - before[1]:>12.1f}"
+    print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--guild-id", type=int, default=-1)
+    args = parser.parse_args()
+
+    db.init_db()
+    header = f"{'模式':<8}{'次/秒':>7}{'upsert p50':>11}{'p95':>10}{'get p50':>10}{'p95':>10}"
+    if server_stats() is not None:
+        header += f"{'plan ms':>12}{'exec ms':>12}"
+    print(header + "（延遲單位 ms）")
+    try:
+        for mode in ("plain", "prepared"):
+            run(mode, args)
+    finally:
+        db.db_bulk_delete_signups(args.guild_id)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""離線壓測 bot 指令：用假的 Interaction 直接呼叫 signup / mysignup / list_signups，不連 Discord。
+
+    python tools/loadtest.py --requests 1000 --concurrency 200
+    python tools/loadtest.py --simulate-db-ms 30      # 不需要 Postgres，模擬阻塞的資料庫呼叫
+
+會印出每個指令的吞吐量、延遲百分位數，以及 asyncio event loop 的延遲（被阻塞呼叫卡住的時間）。
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from collections import Counter, defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BASE_USER_ID = 900_000_000_000_000_000
+JOBS = ["碎夢", "鐵衣", "血河", "神相", "素問", "九靈", "龍吟"]
+
+class FakeResponse:
+    def __init__(self):
+        self.messages = 0
+
+    async def send_message(self, content=None, *, embed=None, file=None, ephemeral=False):
+        self.messages += 1
+
+    async def defer(self, *, ephemeral=False, thinking=False):
+        pass
+
+class FakeFollowup:
+    async def send(self, content=None, *, embed=None, file=None, ephemeral=False):
+        pass
+
+class FakePermissions:
+    manage_guild = True
+
+class FakeUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.name = f"loadtest{user_id % 100000}"
+        self.discriminator = "0"
+        self.display_name = f"壓測{user_id % 100000}"
+        self.guild_permissions = FakePermissions()
+
+class FakeGuild:
+    def __init__(self, guild_id: int):
+        self.id = guild_id
+
+class FakeInteraction:
+    def __init__(self, guild_id: int, user_id: int):
+        self.guild = FakeGuild(guild_id)
+        self.user = FakeUser(user_id)
+        self.channel = None
+        self.response = FakeResponse()
+        self.followup = FakeFollowup()
+
+def simulate_db(bot_worker, delay_ms: float):
+    """把 bot_worker 用到的資料庫函式換成會阻塞 delay_ms 的記憶體版本。"""
+    store = {}
+    delay = delay_ms / 1000.0
+
+    def db_get_signup(guild_id, user_id):
+        time.sleep(delay)
+        return store.get((guild_id, user_id))
+
+    def export_guild_csv(guild_id):
+        from core.export import signups_to_csv
+        time.sleep(delay)
+        return signups_to_csv([dict(v, user_id=k[1]) for k, v in store.items() if k[0] == guild_id])
+
+    def journal_append(guild_id, user_id, info):
+        time.sleep(delay)
+        store[(guild_id, user_id)] = dict(info, team="未分配")
+
+    bot_worker.db_get_signup = db_get_signup
+    bot_worker.export_guild_csv = export_guild_csv
+    bot_worker.journal_append = journal_append
+    bot_worker.journal_latest = lambda guild_id, user_id: None
+
+def percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, round(pct / 100.0 * (len(values) - 1))))
+    return values[k]
+
+async def measure_loop_lag(samples, stop: asyncio.Event, interval: float = 0.01):
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - t0 - interval)
+
+def build_plan(args):
+    weights = {}
+    for part in args.mix.split(","):
+        name, _, w = part.partition("=")
+        weights[name.strip()] = float(w or 1)
+    rng = random.Random(args.seed)
+    kinds = list(weights)
+    return rng.choices(kinds, weights=[weights[k] for k in kinds], k=args.requests)
+
+async def run(args):
+    import bot_worker
+    if args.simulate_db_ms is not None:
+        simulate_db(bot_worker, args.simulate_db_ms)
+
+    handlers = {
+        "signup": lambda it, i: bot_worker.signup.callback(
+            it, job=JOBS[i % len(JOBS)], gear=str(20 + i % 10), availability="週三日 20:30 後",
+            voice="可講話", note="",
+        ),
+        "mysignup": lambda it, i: bot_worker.mysignup.callback(it),
+        "list_signups": lambda it, i: bot_worker.list_signups.callback(it),
+    }
+    plan = build_plan(args)
+    unknown = set(plan) - set(handlers)
+    if unknown:
+        raise SystemExit(f"未知的指令：{', '.join(sorted(unknown))}")
+
+    replay = None
+    if args.replay:
+        from signup_journal import replay_journal_forever
+        replay = asyncio.create_task(replay_journal_forever(bot_worker.journal_wake))
+
+    sem = asyncio.Semaphore(args.concurrency)
+    latencies = defaultdict(list)
+    errors = Counter()
+
+    async def one(i: int, kind: str, t0: float):
+        # 延遲從送出請求開始算（所有請求同時送出），包含排隊與被阻塞的 event loop 耽誤的時間
+        async with sem:
+            interaction = FakeInteraction(args.guild_id, BASE_USER_ID + i % args.users)
+            try:
+                await handlers[kind](interaction, i)
+            except Exception as e:
+                errors[(kind, type(e).__name__)] += 1
+            latencies[kind].append(time.perf_counter() - t0)
+
+    lag, stop = [], asyncio.Event()
+    lag_task = asyncio.create_task(measure_loop_lag(lag, stop))
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i, kind, t0) for i, kind in enumerate(plan)))
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    await lag_task
+    if replay is not None:
+        replay.cancel()
+
+    print(f"共 {len(plan)} 次呼叫，並行 {args.concurrency}，耗時 {elapsed:.2f}s，吞吐量 {len(plan) / elapsed:.1f} req/s")
+    print(f"{'指令':<14}{'次數':>7}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for kind, values in sorted(latencies.items()):
+        ms = [v * 1000 for v in values]
+        print(
+            f"{kind:<14}{len(ms):>7}{len(ms) / elapsed:>9.1f}"
+            f"{percentile(ms, 50):>9.1f}{percentile(ms, 95):>9.1f}{percentile(ms, 99):>9.1f}{max(ms):>9.1f}"
+        )
+    lag_ms = [v * 1000 for v in lag]
+    print(
+        f"event loop 延遲：p50 {percentile(lag_ms, 50):.1f} ms，p99 {percentile(lag_ms, 99):.1f} ms，"
+        f"max {max(lag_ms, default=0):.1f} ms（{len(lag_ms)} 次取樣）"
+    )
+    for (kind, err), count in sorted(errors.items()):
+        print(f"⚠️ {kind} 失敗 {count} 次：{err}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1000, help="總呼叫次數")
+    parser.add_argument("--concurrency", type=int, default=200, help="同時進行的呼叫數")
+    parser.add_argument("--users", type=int, default=200, help="模擬的成員數")
+    parser.add_argument("--guild-id", type=int, default=1, help="寫入的伺服器 ID（請用測試用的 ID）")
+    parser.add_argument("--mix", default="signup=1,mysignup=1,list_signups=0.05", help="指令比例")
+    parser.add_argument("--simulate-db-ms", type=float, default=None, help="不連 Postgres，改用阻塞 N 毫秒的假資料庫")
+    parser.add_argument("--replay", action="store_true", help="同時執行報名日誌回放（會寫入 Postgres）")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # 壓測用獨立的日誌檔，不影響正式的報名日誌
+    os.environ.setdefault("SIGNUP_JOURNAL_PATH", os.path.join(tempfile.mkdtemp(), "loadtest_journal.sqlite3"))
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
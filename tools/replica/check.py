@@ -0,0 +1,34 @@
+"""確認讀取路由：顯示副本延遲，並示範寫入後的讀取會改走主庫。
+
+需要 DATABASE_URL（主庫）與 DATABASE_REPLICA_URL（副本），見同資料夾的 docker-compose.yml。
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from core import db
+
+GUILD_ID = 1  # 測試用的伺服器 ID
+USER_ID = 1
+
+def served_by(guild_id=None, user_id=None) -> str:
+    with db.get_read_conn(guild_id, user_id) as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_is_in_recovery();")
+            return "副本" if cur.fetchone()[0] else "主庫"
+
+def main():
+    db.init_db()
+    print(f"寫入前讀取：{served_by(GUILD_ID, USER_ID)}；副本狀態：{db.replica_status()}")
+
+    db.db_upsert_signup(GUILD_ID, USER_ID, {"display_name": "replica-check", "timestamp": str(time.time())})
+    print(f"剛寫入後讀取：{served_by(GUILD_ID, USER_ID)}（read-your-writes）")
+    print(f"其他伺服器讀取：{served_by(GUILD_ID + 1)}")
+
+    time.sleep(db.READ_YOUR_WRITES_SECONDS + 0.5)
+    print(f"{db.READ_YOUR_WRITES_SECONDS:.0f} 秒後讀取：{served_by(GUILD_ID, USER_ID)}")
+
+if __name__ == "__main__":
+    main()
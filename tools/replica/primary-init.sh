@@ -0,0 +1,3 @@
+#!/bin/bash
+# 允許副本用 postgres 帳號做串流複寫
+echo "host replication all all scram-sha-256" >> "$PGDATA/pg_hba.conf"
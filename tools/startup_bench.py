@@ -0,0 +1,53 @@
+"""量測各個進入點的冷啟動時間與記憶體（RSS），並列出載入了哪些重量級套件。
+
+    python tools/startup_bench.py
+    python tools/startup_bench.py --runs 10 web_app bot_worker
+
+每次都開一個新的 Python 行程只做 import（不連線、不啟動服務），取中位數。
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY_POINTS = ["web_app", "bot_worker", "bot_web_app"]
+HEAVY_MODULES = ["discord", "aiohttp", "flask", "werkzeug", "jinja2", "psycopg2"]
+
+PROBE = """
+import json, resource, sys, time
+t0 = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - t0
+print(json.dumps({{
+    "seconds": elapsed,
+    "rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "loaded": [m for m in {heavy!r} if m in sys.modules],
+}}))
+"""
+
+def measure(module: str):
+    code = PROBE.format(module=module, heavy=HEAVY_MODULES)
+    out = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=ENTRY_POINTS)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'進入點':<14}{'import ms':>11}{'RSS MB':>9}  載入的套件")
+    for module in args.modules:
+        results = [measure(module) for _ in range(args.runs)]
+        ms = statistics.median(r["seconds"] for r in results) * 1000
+        rss = statistics.median(r["rss_kb"] for r in results) / 1024
+        print(f"{module:<14}{ms:>11.1f}{rss:>9.1f}  {', '.join(results[-1]['loaded']) or '（無）'}")
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,20 @@
 import os
-from flask import Flask, render_template_string, request, redirect, url_for
+import hmac
+import gzip
+import json
+import time
+import hashlib
+from datetime import datetime, timedelta, timezone
 
-from db import init_db, db_list_all_signups, db_update_team
+import psycopg2
+from flask import Flask, Response, abort, g, render_template_string, request, redirect, send_file, url_for
+
+from core.db import (
+    init_db, db_list_all_signups, db_update_teams, db_bulk_set_team, db_bulk_delete_signups,
+    db_page_signups, primary_reads, db_health, READ_YOUR_WRITES_SECONDS,
+)
+from core.roster import TEAMS, TEAM_CLASSES, normalize_team
+from core.export import start_export, get_export
 
 app = Flask(__name__)
 
@@ -45,6 +58,12 @@ HTML_TEMPLATE = """
     button { margin-top:12px; padding:6px 14px; border-radius:999px; border:none; background:#00e8d1; color:#020617; font-weight:600; cursor:pointer; font-size:13px; }
     button:hover { opacity:0.92; }
 
+    .bulk-block { border-radius:16px; padding:12px 16px; margin-bottom:18px; border:1px solid #1f2937; font-size:12px; }
+    .bulk-block label { margin-right:10px; white-space:nowrap; }
+    .bulk-block input[type=text], .bulk-block input[type=number] { background:#020617; color:#e5e7eb; border:1px solid #374151; padding:2px 6px; border-radius:6px; font-size:11px; width:90px; }
+    .bulk-row { margin-bottom:6px; }
+    .flash { color:#00e8d1; font-size:12px; margin-bottom:12px; }
+
     .badge { display:inline-flex; align-items:center; padding:2px 8px; border-radius:999px; font-size:11px; font-weight:500; }
     .badge.team-off1 { background:#f97316; color:#0b1120; }
     .badge.team-off2 { background:#facc15; color:#0b1120; }
@@ -68,6 +87,55 @@ HTML_TEMPLATE = """
     {% endfor %}
   </div>
 
+  {% if message %}<p class="flash">{{ message }}</p>{% endif %}
+
+  <form class="bulk-block" method="post" action="{{ url_for('bulk') }}">
+    <div class="bulk-row">
+      <strong>批次操作</strong>
+      <label>伺服器
+        <select name="guild_id">
+          {% for g in guild_ids %}<option value="{{ g }}">{{ g }}</option>{% endfor %}
+        </select>
+      </label>
+      <label>動作
+        <select name="action">
+          <option value="move">移到隊伍</option>
+          <option value="clear">刪除報名</option>
+        </select>
+      </label>
+      <label>目標隊伍
+        <select name="to_team">
+          {% for t in teams_order %}<option value="{{ t }}">{{ t }}</option>{% endfor %}
+        </select>
+      </label>
+    </div>
+    <div class="bulk-row">
+      <label>
+        <select name="team_mode">
+          <option value="only">只處理</option>
+          <option value="except">排除</option>
+        </select>
+      </label>
+      {% for t in teams_order %}
+        <label><input type="checkbox" name="teams" value="{{ t }}"> {{ t }}</label>
+      {% endfor %}
+      <span class="muted">（都不勾 = 全部隊伍）</span>
+    </div>
+    <div class="bulk-row">
+      <label>職業（逗號分隔）<input type="text" name="jobs"></label>
+      <label>超過幾天未更新 <input type="number" name="inactive_days" min="1"></label>
+      <label><input type="checkbox" name="confirm" value="1"> 確認執行</label>
+      <input type="hidden" name="bulk_token" value="{{ bulk_token }}">
+    </div>
+    <button type="submit">⚡ 執行批次操作</button>
+  </form>
+
+  <form class="bulk-block" method="post" action="{{ url_for('create_export') }}">
+    <strong>匯出 CSV</strong>
+    <label>伺服器 ID（逗號分隔，留空 = 全部）<input type="text" name="guild_ids" style="width:240px"></label>
+    <button type="submit">📦 匯出 zip</button>
+  </form>
+
   <form method="post" action="{{ url_for('index') }}">
     {% for sec in sections %}
       <div class="team-block">
@@ -126,32 +194,210 @@ HTML_TEMPLATE = """
 </html>
 """
 
+# 剛存檔過的瀏覽器帶著這個 cookie，之後的頁面改從主庫讀，才看得到自己的修改
+RECENT_WRITE_COOKIE = "recent_write"
+
+@app.before_request
+def route_reads_after_write():
+    if request.cookies.get(RECENT_WRITE_COOKIE):
+        g.primary_reads = primary_reads()
+        g.primary_reads.__enter__()
+
+@app.teardown_request
+def reset_read_routing(exc):
+    cm = g.pop("primary_reads", None)
+    if cm is not None:
+        cm.__exit__(None, None, None)
+
+def redirect_after_write(location: str):
+    resp = redirect(location)
+    resp.set_cookie(RECENT_WRITE_COOKIE, "1", max_age=int(READ_YOUR_WRITES_SECONDS), httponly=True)
+    return resp
+
+# 後台頁面用到的欄位（不含 user_name / updated_at）
+INDEX_COLUMNS = ["guild_id", "user_id", "display_name", "job", "gear", "availability", "voice", "note", "team", "timestamp"]
+API_MAX_LIMIT = 500
+GZIP_MIN_BYTES = 1024
+
+def _json_value(v):
+    # Discord ID 超過 JS 的安全整數範圍，一律轉成字串
+    if isinstance(v, int):
+        return str(v)
+    if isinstance(v, datetime):
+        return v.isoformat()
+    return v
+
+def json_response(payload, status: int = 200) -> Response:
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    resp = Response(body, status=status, mimetype="application/json")
+    resp.headers["Vary"] = "Accept-Encoding"
+    if len(body) >= GZIP_MIN_BYTES and "gzip" in request.headers.get("Accept-Encoding", ""):
+        resp.set_data(gzip.compress(body, compresslevel=6))
+        resp.headers["Content-Encoding"] = "gzip"
+    return resp
+
+@app.route("/api/guilds/<int:guild_id>/signups")
+def api_guild_signups(guild_id: int):
+    fields = [f.strip() for f in request.args.get("fields", "").split(",") if f.strip()]
+    teams = request.args.getlist("team")
+    try:
+        limit = min(max(int(request.args.get("limit", 100)), 1), API_MAX_LIMIT)
+        cursor = request.args.get("cursor")
+        after_user_id = int(cursor) if cursor else None
+        rows, next_user_id = db_page_signups(guild_id, fields or None, teams or None, after_user_id, limit)
+    except ValueError as e:
+        return json_response({"error": str(e)}, status=400)
+
+    return json_response({
+        "guild_id": str(guild_id),
+        "signups": [{k: _json_value(v) for k, v in r.items()} for r in rows],
+        "next_cursor": str(next_user_id) if next_user_id is not None else None,
+    })
+
+@app.errorhandler(psycopg2.OperationalError)
+def database_unavailable(e):
+    # 連不上、查詢逾時、斷路器開啟（DatabaseUnavailable）都回 503，不是程式錯誤
+    if request.path.startswith("/api/"):
+        return json_response({"error": str(e)}, status=503)
+    return Response(f"🚫 {e}", status=503, mimetype="text/plain")
+
+@app.route("/healthz")
+def healthz():
+    # db_health 會先跑一次 SELECT 1，沒有流量時也能發現資料庫斷線
+    health = db_health()
+    status = 200 if health["primary"]["reachable"] else 503
+    return json_response(health, status=status)
+
+EXPORT_STATUS_TEMPLATE = """
+<!DOCTYPE html>
+<html lang="zh-Hant">
+<head>
+  <meta charset="utf-8" />
+  <title>匯出幫戰報名</title>
+  {% if job.state in ("pending", "running") %}<meta http-equiv="refresh" content="1">{% endif %}
+  <style>
+    body { font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", sans-serif; padding: 24px; background: #020617; color: #e6edf7; }
+    a { color: #00e8d1; }
+  </style>
+</head>
+<body>
+  <h1>📦 匯出幫戰報名</h1>
+  {% if job.state == "done" %}
+    <p>已完成 {{ job.done }} 個伺服器、{{ job.rows }} 筆報名。<a href="{{ url_for('download_export', job_id=job.id) }}">下載 zip</a></p>
+  {% elif job.state == "failed" %}
+    <p>匯出失敗：{{ job.error }}</p>
+  {% else %}
+    <p>匯出中… {{ job.done }} / {{ job.total or "?" }} 個伺服器</p>
+  {% endif %}
+  <p><a href="{{ url_for('index') }}">回到後台</a></p>
+</body>
+</html>
+"""
+
+@app.route("/exports", methods=["POST"])
+def create_export():
+    raw = request.form.get("guild_ids", "").replace("，", ",")
+    try:
+        guild_ids = [int(g) for g in raw.split(",") if g.strip()]
+    except ValueError:
+        return redirect(url_for("index", message="伺服器 ID 格式錯誤。"))
+    job = start_export(guild_ids or None)
+    return redirect(url_for("export_status", job_id=job.id))
+
+@app.route("/exports/<job_id>")
+def export_status(job_id: str):
+    job = get_export(job_id)
+    if job is None:
+        abort(404)
+    if request.args.get("format") == "json":
+        return json_response(job.progress())
+    return render_template_string(EXPORT_STATUS_TEMPLATE, job=job)
+
+@app.route("/exports/<job_id>/download")
+def download_export(job_id: str):
+    job = get_export(job_id)
+    if job is None or job.state != "done":
+        abort(404)
+    return send_file(job.path, mimetype="application/zip", as_attachment=True, download_name="signups.zip")
+
+# 批次操作表單帶的簽章 token：只有從後台頁面送出的才算數（擋掉其他網站偽造的 POST）
+# 多個 worker（gunicorn -w N）或多台機器部署時一定要設定 WEB_SECRET_KEY，所有 worker 才會用同一把 key
+BULK_TOKEN_SECRET = os.environ.get("WEB_SECRET_KEY", "").encode()
+if not BULK_TOKEN_SECRET:
+    BULK_TOKEN_SECRET = os.urandom(32)
+    print(
+        "⚠️⚠️ 環境變數 WEB_SECRET_KEY 未設定：批次操作 token 改用這個行程自己的隨機 key。"
+        "多個 worker 或重新啟動後，其他行程簽出的 token 會被當成過期，請設定 WEB_SECRET_KEY。"
+    )
+BULK_TOKEN_MAX_AGE = 3600
+
+def make_bulk_token() -> str:
+    issued = str(int(time.time()))
+    return issued + "." + hmac.new(BULK_TOKEN_SECRET, issued.encode(), hashlib.sha256).hexdigest()
+
+def check_bulk_token(token: str) -> bool:
+    issued, _, sig = token.partition(".")
+    if not issued.isdigit() or time.time() - int(issued) > BULK_TOKEN_MAX_AGE:
+        return False
+    expected = hmac.new(BULK_TOKEN_SECRET, issued.encode(), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(sig, expected)
+
+@app.route("/bulk", methods=["POST"])
+def bulk():
+    form = request.form
+    if not check_bulk_token(form.get("bulk_token", "")):
+        return redirect(url_for("index", message="頁面已過期，請重新整理後再執行批次操作。"))
+    if not form.get("confirm"):
+        return redirect(url_for("index", message="請勾選「確認執行」後再送出批次操作。"))
+
+    teams = form.getlist("teams")
+    if any(t not in TEAMS for t in teams):
+        return redirect(url_for("index", message="未知的隊伍。"))
+    filters = {
+        "teams": teams if form.get("team_mode") == "only" else None,
+        "exclude_teams": teams if form.get("team_mode") == "except" else None,
+        "jobs": [j.strip() for j in form.get("jobs", "").replace("，", ",").split(",") if j.strip()],
+        "updated_before": None,
+    }
+    try:
+        guild_id = int(form.get("guild_id", ""))
+        inactive_days = int(form.get("inactive_days") or 0)
+    except ValueError:
+        return redirect(url_for("index", message="伺服器 ID 或天數格式錯誤。"))
+    if inactive_days < 0:
+        return redirect(url_for("index", message="天數不可為負數。"))
+    if inactive_days:
+        filters["updated_before"] = datetime.now(timezone.utc) - timedelta(days=inactive_days)
+
+    if form.get("action") == "clear":
+        count = db_bulk_delete_signups(guild_id, **filters)
+        message = f"已刪除 {count} 筆報名。"
+    else:
+        if form.get("to_team") not in TEAMS:
+            return redirect(url_for("index", message="請選擇要移到的隊伍。"))
+        count = db_bulk_set_team(guild_id, form["to_team"], **filters)
+        message = f"已將 {count} 人移到「{form['to_team']}」。"
+    return redirect_after_write(url_for("index", message=message))
+
 @app.route("/", methods=["GET", "POST"])
 def index():
     if request.method == "POST":
+        changes = []
         for key, value in request.form.items():
             if not key.startswith("team_"):
                 continue
             _, gid, uid = key.split("_", 2)
-            db_update_team(int(gid), int(uid), value)
-        return redirect(url_for("index"))
-
-    rows_raw = db_list_all_signups()
-    teams_order = ["進攻1", "進攻2", "防守", "替補", "請假", "未分配"]
-    class_map = {
-        "進攻1": "team-off1",
-        "進攻2": "team-off2",
-        "防守": "team-def",
-        "替補": "team-sub",
-        "請假": "team-leave",
-        "未分配": "team-unassigned",
-    }
+            changes.append((int(gid), int(uid), value))
+        db_update_teams(changes)
+        return redirect_after_write(url_for("index"))
+
+    rows_raw = db_list_all_signups(INDEX_COLUMNS)
+    teams_order = TEAMS
+    class_map = TEAM_CLASSES
 
     team_blocks = {t: [] for t in teams_order}
     for r in rows_raw:
-        team = r.get("team") or "未分配"
-        if team not in team_blocks:
-            team = "未分配"
+        team = normalize_team(r.get("team"))
 
         row = {
             "guild_id": str(r["guild_id"]),
@@ -182,6 +428,9 @@ def index():
         summary=summary,
         total=total,
         teams_order=teams_order,
+        guild_ids=sorted({str(r["guild_id"]) for r in rows_raw}),
+        message=request.args.get("message", ""),
+        bulk_token=make_bulk_token(),
     )
 
 def main():